@@ -0,0 +1,217 @@
+# Concurrent, rate-limited HTTP fetching with asyncio
+#
+# Used by sel_scrape to download school pages.  A fixed number of workers
+# share a token bucket, so at most `concurrency` requests are in flight and
+# on average no more than `rate` start per second (with bursts of up to
+# `burst`).  Connections are HTTP/1.1 keep-alive and pooled per host, failed
+# requests (network errors, 429 and 5xx) are retried with exponential
+# backoff, and each page is handed to a callback as soon as it arrives.
+# Only the standard library is needed: requests go over asyncio streams.
+
+import asyncio
+import ssl
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+Response = namedtuple('Response', ['url', 'status', 'headers', 'body'])
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+
+class HTTPError(Exception):
+    def __init__(self, url, status):
+        super(HTTPError, self).__init__('%s returned %d' % (url, status))
+        self.url = url
+        self.status = status
+
+
+class TokenBucket(object):
+    """Allows `rate` acquisitions per second on average, and up to `burst` at once"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_event_loop()
+        # the lock makes waiters take tokens in turn
+        async with self.lock:
+            while True:
+                now = loop.time()
+                if self.last is not None:
+                    self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ConnectionPool(object):
+    """Idle keep-alive connections, per (scheme, host, port)"""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.idle = {}
+        self.ssl_context = ssl.create_default_context()
+
+    async def _connect(self, scheme, host, port):
+        if scheme == 'https':
+            return await asyncio.open_connection(host, port, ssl=self.ssl_context,
+                                                 server_hostname=host)
+        return await asyncio.open_connection(host, port)
+
+    async def request(self, url, headers=None):
+        '''
+            GET `url` on a pooled connection (following redirects) and return
+            the Response.  Connections with an error are closed, not reused.
+        '''
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await asyncio.wait_for(self._request_once(url, headers), self.timeout)
+            if response.status not in REDIRECT_STATUSES or 'location' not in response.headers:
+                return response
+            url = urljoin(url, response.headers['location'])
+        raise HTTPError(url, response.status)
+
+    async def _request_once(self, url, headers):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        idle = self.idle.setdefault(key, [])
+        reader, writer = idle.pop() if idle else await self._connect(*key)
+        try:
+            lines = ['GET %s HTTP/1.1' % path,
+                     'Host: %s' % parts.netloc,
+                     'Connection: keep-alive',
+                     'Accept-Encoding: identity']
+            lines += ['%s: %s' % item for item in (headers or {}).items()]
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await writer.drain()
+            status, response_headers, body, reusable = await _read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        if reusable and response_headers.get('connection', '').lower() != 'close':
+            idle.append((reader, writer))
+        else:
+            writer.close()
+        return Response(url, status, response_headers, body)
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle = {}
+
+
+async def _read_response(reader):
+    """(status, lower-cased headers, body, whether the connection can be reused)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by server')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    # these never have a body, even when they carry a Content-Length (a 304 may
+    # send the length of the full resource)
+    if status in (204, 304) or 100 <= status < 200:
+        return status, headers, b'', True
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await reader.readline()).strip():
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return status, headers, b''.join(chunks), True
+    if 'content-length' in headers:
+        return status, headers, await reader.readexactly(int(headers['content-length'])), True
+    # no framing: the body runs until the server closes the connection
+    return status, headers, await reader.read(), False
+
+
+async def fetch_all(urls, on_response, concurrency=4, rate=1.0, burst=1, retries=3, backoff=2.0,
+                    timeout=30, headers=None):
+    '''
+        Fetch every url in `urls` (a dict of key -> url) and call
+        on_response(key, response) as each successful (2xx/304) response
+        arrives.  headers may be a dict, or a function of the key returning
+        one.  Returns a dict of key -> the exception for requests that still
+        failed after `retries` retries.  Only requests are retried: if
+        on_response raises, the requests still running are cancelled and the
+        exception is passed on.
+    '''
+    bucket = TokenBucket(rate, burst)
+    pool = ConnectionPool(timeout)
+    queue = asyncio.Queue()
+    for item in urls.items():
+        queue.put_nowait(item)
+    failures = {}
+
+    async def fetch(key, url):
+        request_headers = headers(key) if callable(headers) else headers
+        for attempt in range(retries + 1):
+            await bucket.acquire()
+            try:
+                response = await pool.request(url, request_headers)
+                if response.status in RETRY_STATUSES:
+                    raise HTTPError(url, response.status)
+                break
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError,
+                    HTTPError) as e:
+                if attempt == retries:
+                    failures[key] = e
+                    return
+                await asyncio.sleep(backoff * 2 ** attempt)
+        if not (200 <= response.status < 300 or response.status == 304):
+            # e.g. a 404 won't change on retry
+            failures[key] = HTTPError(url, response.status)
+            return
+        on_response(key, response)
+
+    async def worker():
+        while not queue.empty():
+            key, url = queue.get_nowait()
+            await fetch(key, url)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, max(len(urls), 1)))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # after an error, don't leave the other workers running
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        pool.close()
+    return failures
+
+
+def run(coroutine):
+    """Run a coroutine to completion on a fresh event loop"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
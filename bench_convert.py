@@ -0,0 +1,102 @@
+# Benchmark: row-wise cleanup helpers vs. the vectorized ones in util.
+# We build a synthetic school explorer by resampling the rows of the raw
+# 2016 explorer up to the requested size (1M rows by default), then time the
+# conversion of the 23 columns prep_explorer.py cleans up.
+#
+# Usage: python bench_convert.py [n_rows]
+
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+import util
+
+PERCENT_COLUMNS = ['Percent ELL', 'Percent Asian', 'Percent Black', 'Percent Hispanic',
+                   'Percent Black / Hispanic', 'Percent White', 'Student Attendance Rate',
+                   'Percent of Students Chronically Absent', 'Rigorous Instruction %',
+                   'Collaborative Teachers %', 'Supportive Environment %',
+                   'Effective School Leadership %', 'Strong Family-Community Ties %', 'Trust %']
+MONEY_COLUMNS = ['School Income Estimate']
+RATING_COLUMNS = ['Rigorous Instruction Rating', 'Collaborative Teachers Rating',
+                  'Supportive Environment Rating', 'Effective School Leadership Rating',
+                  'Strong Family-Community Ties Rating', 'Trust Rating',
+                  'Student Achievement Rating']
+BINARY_COLUMNS = ['Community School?']
+
+
+### The original row-wise helpers, kept here as the baseline
+
+def _missing(s):
+    return s != s or s == 'nan'
+
+def legacy_pct_to_number(df, col):
+    return df[col].astype(str).apply(lambda s: int(s.strip('%')) if not _missing(s) else np.nan)
+
+def legacy_money_to_number(df, col):
+    return df[col].astype(str).apply(lambda s: float(re.sub('[$,]', '', s)) if not _missing(s) else np.nan)
+
+def legacy_rating_to_number(df, col):
+    return df[col].astype(str).apply(lambda s: util.RATINGS.get(s, 0) if not _missing(s) else np.nan)
+
+def legacy_to_binary(df, col):
+    return df[col].astype(str).apply(lambda s: 1 if s == 'Yes' else 0)
+
+
+def make_synthetic_explorer(n_rows, random_state=207):
+    raw = pd.read_csv('data_raw/2016_school_explorer.csv',
+                      usecols=PERCENT_COLUMNS + MONEY_COLUMNS + RATING_COLUMNS + BINARY_COLUMNS)
+    rows = np.random.RandomState(random_state).randint(0, raw.shape[0], n_rows)
+    return raw.iloc[rows].reset_index(drop=True)
+
+def run_legacy(df):
+    out = df.copy()
+    for col in PERCENT_COLUMNS:
+        out[col] = legacy_pct_to_number(df, col)
+    for col in MONEY_COLUMNS:
+        out[col] = legacy_money_to_number(df, col)
+    for col in RATING_COLUMNS:
+        out[col] = legacy_rating_to_number(df, col)
+    for col in BINARY_COLUMNS:
+        out[col] = legacy_to_binary(df, col)
+    return out
+
+def run_per_column(df):
+    out = df.copy()
+    for col in PERCENT_COLUMNS:
+        out[col] = util.pct_to_number(df, col)
+    for col in MONEY_COLUMNS:
+        out[col] = util.money_to_number(df, col)
+    for col in RATING_COLUMNS:
+        out[col] = util.rating_to_number(df, col)
+    for col in BINARY_COLUMNS:
+        out[col] = util.to_binary(df, col)
+    return out
+
+def run_single_pass(df):
+    return util.convert_columns(df, percent_columns=PERCENT_COLUMNS,
+                                money_columns=MONEY_COLUMNS,
+                                rating_columns=RATING_COLUMNS,
+                                binary_columns=BINARY_COLUMNS)
+
+def timed(func, df):
+    start = time.time()
+    result = func(df)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    df = make_synthetic_explorer(n_rows)
+    print('Synthetic explorer: %d rows x %d columns' % df.shape)
+
+    baseline, t_legacy = timed(run_legacy, df)
+    print('row-wise helpers:       %8.2fs' % t_legacy)
+    for name, func in [('vectorized per column:', run_per_column),
+                       ('convert_columns:      ', run_single_pass)]:
+        result, took = timed(func, df)
+        # results must match the row-wise helpers exactly (NaNs and dtypes included)
+        same = (result.dtypes.equals(baseline.dtypes) and
+                np.allclose(result.values.astype(float), baseline.values.astype(float),
+                            equal_nan=True))
+        print('%s %8.2fs (%.1fx faster, matches: %s)' % (name, took, t_legacy / took, same))
@@ -0,0 +1,66 @@
+# Benchmark: extracting the gifted / selective flags from the cached pages.
+# Compares the original approach (a full BeautifulSoup DOM of every page),
+# BeautifulSoup limited to the school-icons divs with a SoupStrainer, and the
+# fragment tokenizer in schoolicons, serially and across a process pool.
+#
+# Usage: python bench_icons.py [page_dir] [n_jobs]
+
+import os
+import sys
+import time
+from collections import OrderedDict
+from bs4 import BeautifulSoup, SoupStrainer
+import schoolicons
+
+
+### The original parser, kept here as the baseline
+
+def legacy_flags(dbn, html, parse_only=None):
+    soup = BeautifulSoup(html, "html.parser", parse_only=parse_only)
+    rows = []
+    for div in soup.find_all("div", {"class": "school-icons"}):
+        gifted = '0'
+        selective = '0'
+        for span in div.find_all("span"):
+            if "icon-gifted" in span['class']:
+                gifted = '1'
+            if "icon-highly-selective" in span['class']:
+                selective = '1'
+            if dbn == '18K235':
+                gifted = '1'
+        rows.append((gifted, selective))
+    return rows
+
+def strained_flags(dbn, html):
+    return legacy_flags(dbn, html, SoupStrainer("div", {"class": "school-icons"}))
+
+def run_serial(paths, flags):
+    results = OrderedDict()
+    for path in paths:
+        dbn = os.path.basename(path).split('.')[0]
+        with open(path, 'r', encoding='utf-8') as f:
+            results[dbn] = flags(dbn, f.read())
+    return results
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    page_dir = sys.argv[1] if len(sys.argv) > 1 else 'schoolinfo'
+    n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    paths = schoolicons.page_files(page_dir)
+    size = sum(os.path.getsize(path) for path in paths)
+    print('%d pages, %.1f MB' % (len(paths), size / 2**20))
+
+    baseline, t_legacy = timed(run_serial, paths, legacy_flags)
+    print('BeautifulSoup (full DOM):    %7.2fs' % t_legacy)
+    runs = [('BeautifulSoup + strainer:   ', lambda: run_serial(paths, strained_flags)),
+            ('fragment tokenizer:         ', lambda: run_serial(paths, schoolicons.extract_flags)),
+            ('tokenizer, %2d processes:    ' % n_jobs,
+             lambda: schoolicons.extract_categories(paths, n_jobs=n_jobs))]
+    for name, func in runs:
+        result, took = timed(func)
+        print('%s %7.2fs (%.1fx faster, matches: %s)' % (name, took, t_legacy / took, result == baseline))
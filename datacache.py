@@ -0,0 +1,143 @@
+# On-disk cache for parsed (and optionally imputed) dataframes
+#
+# Each cached frame lives in its own directory under cache_data/, named by a
+# hash of the source file's contents plus the options used to build it.  Each
+# run of adjacent columns with the same numeric dtype is stored as one
+# (columns x rows) .npy file, which is exactly how pandas lays out a block of
+# one dtype; so a reload skips CSV parsing and imputation entirely, and the
+# frame wraps the memory-mapped files without copying them.  Text and other
+# object columns are stored (and read) one column per file.
+
+import hashlib
+import json
+import os
+import shutil
+import warnings
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'cache_data'
+# bump when the layout of cached frames changes, so old entries aren't reused
+CACHE_VERSION = 3
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-1 of a file's contents"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def cache_key(source_file, **options):
+    """Key for a frame built from `source_file` with the given options"""
+    key = {'source': file_hash(source_file), 'options': options, 'version': CACHE_VERSION}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def column_array(series):
+    '''
+        A column's values as an ndarray that np.save can store, and its kind:
+        'str' (fixed-width unicode), 'object' (needs pickling) or the dtype name
+    '''
+    values = series.values
+    if not isinstance(values, np.ndarray) or values.dtype == object:
+        values = np.asarray(values, dtype=object)
+        # strings without missing values become fixed-width unicode, which
+        # np.load can memory-map; anything else has to be pickled
+        if series.notnull().all() and series.map(type).eq(str).all():
+            return values.astype(str), 'str'
+        return values, 'object'
+    return values, str(values.dtype)
+
+def _is_numeric(kind):
+    return kind not in ('str', 'object')
+
+def _column_runs(df):
+    """(kind, column names, arrays) for each run of adjacent numeric columns of one dtype
+    (text and object columns are runs of their own)"""
+    runs = []
+    for col in df.columns:
+        values, kind = column_array(df[col])
+        if runs and _is_numeric(kind) and runs[-1][0] == kind:
+            runs[-1][1].append(col)
+            runs[-1][2].append(values)
+        else:
+            runs.append((kind, [col], [values]))
+    return runs
+
+def store_frame(key, df, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, key)
+    tmp_path = path + '.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+
+    blocks = []
+    for i, (kind, names, arrays) in enumerate(_column_runs(df)):
+        values = np.stack(arrays) if _is_numeric(kind) else arrays[0]
+        np.save(os.path.join(tmp_path, '%d.npy' % i), values, allow_pickle=(kind == 'object'))
+        blocks.append({'kind': kind, 'columns': names})
+    values, kind = column_array(df.index.to_series())
+    np.save(os.path.join(tmp_path, 'index.npy'), values, allow_pickle=(kind == 'object'))
+    with open(os.path.join(tmp_path, 'columns.json'), 'w') as f:
+        json.dump({'blocks': blocks, 'index': {'kind': kind, 'name': df.index.name}}, f)
+
+    # rename into place last, so readers never see a half-written entry
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another run stored the same entry first
+        shutil.rmtree(tmp_path)
+
+def _load_array(path, kind, mmap):
+    pickled = kind == 'object'
+    # copy-on-write mapping: the frame can still be modified, in memory only
+    values = np.load(path, mmap_mode='c' if (mmap and not pickled) else None, allow_pickle=pickled)
+    return values.astype(object) if kind == 'str' else values
+
+def _concat_columns(frames):
+    with warnings.catch_warnings():
+        # older pandas copies every block here unless told not to; newer
+        # pandas never does, and deprecates the keyword
+        warnings.simplefilter('ignore', DeprecationWarning)
+        return pd.concat(frames, axis=1, copy=False)
+
+def load_frame(key, cache_dir=CACHE_DIR, mmap=True):
+    '''
+        Load a cached frame, or return None if there's no entry for `key`.
+        With mmap, numeric columns stay memory-mapped: the frame's blocks are
+        the mapped files themselves.
+    '''
+    path = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(path, 'columns.json')) as f:
+            layout = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    frames = []
+    for i, block in enumerate(layout['blocks']):
+        values = _load_array(os.path.join(path, '%d.npy' % i), block['kind'], mmap)
+        if _is_numeric(block['kind']):
+            # DataFrame keeps a 2-d array's transpose as its block, which is our array again
+            frames.append(pd.DataFrame(values.T, columns=block['columns'], copy=False))
+        else:
+            frames.append(pd.DataFrame({block['columns'][0]: values}))
+
+    index = pd.Index(_load_array(os.path.join(path, 'index.npy'), layout['index']['kind'], False),
+                     name=layout['index']['name'])
+    if not frames:
+        return pd.DataFrame(index=index)
+    df = frames[0] if len(frames) == 1 else _concat_columns(frames)
+    df.index = index
+    return df
+
+def cached_frame(source_file, build, cache_dir=CACHE_DIR, **options):
+    '''
+        Return build(source_file, **options), from the cache when the same
+        source contents and options were seen before.
+    '''
+    key = cache_key(source_file, **options)
+    df = load_frame(key, cache_dir)
+    if df is None:
+        df = build(source_file, **options)
+        store_frame(key, df, cache_dir)
+    return df
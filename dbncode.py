@@ -0,0 +1,68 @@
+# Compact integer codes for DBNs
+#
+# A DBN such as '01M034' is a two digit district, a borough letter and a three
+# digit school number.  We pack it into an int32 as
+#
+#     district * 10000 + borough * 1000 + number     ('01M034' -> 11034)
+#
+# with boroughs numbered in alphabetical order (K, M, Q, R, X), so codes sort
+# in the same order as the DBN strings.  Frames are indexed by these codes in
+# memory, which makes joins and lookups integer operations; files on disk and
+# anything shown to a person keep the string DBN (see decode / with_dbn_index).
+
+import numpy as np
+import pandas as pd
+
+BOROUGH_LETTERS = 'KMQRX'
+INDEX_NAME = 'dbn_code'
+DBN_PATTERN = r'^\d{2}[%s]\d{3}$' % BOROUGH_LETTERS
+
+# character code -> borough number (-1 for anything that isn't a borough letter)
+_BOROUGH_OF_CHAR = np.full(128, -1, dtype=np.int32)
+_BOROUGH_OF_CHAR[[ord(c) for c in BOROUGH_LETTERS]] = np.arange(len(BOROUGH_LETTERS))
+
+
+def encode(dbns):
+    """int32 code of each DBN string; raises ValueError on malformed DBNs"""
+    dbns = np.asarray(dbns, dtype=object)
+    valid = pd.Series(dbns).str.match(DBN_PATTERN).fillna(False).astype(bool).values
+    if not valid.all():
+        raise ValueError('malformed DBNs: %s' % list(pd.unique(dbns[~valid])[:5]))
+
+    # view the fixed-width strings as a (n x 6) array of character codes
+    chars = dbns.astype('U6').view(np.uint32).reshape(-1, 6).astype(np.int32)
+    digits = chars - ord('0')
+    district = 10 * digits[:, 0] + digits[:, 1]
+    number = 100 * digits[:, 3] + 10 * digits[:, 4] + digits[:, 5]
+    return (10000 * district + 1000 * _BOROUGH_OF_CHAR[chars[:, 2]] + number).astype(np.int32)
+
+def decode(codes):
+    """DBN string of each code (object array)"""
+    codes = np.asarray(codes, dtype=np.int64)
+    district, rest = np.divmod(codes, 10000)
+    borough, number = np.divmod(rest, 1000)
+    if (district > 99).any() or (borough >= len(BOROUGH_LETTERS)).any() or (codes < 0).any():
+        raise ValueError('not DBN codes')
+
+    zero = ord('0')
+    chars = np.column_stack([zero + district // 10, zero + district % 10,
+                             np.frombuffer(BOROUGH_LETTERS.encode('ascii'), dtype=np.uint8)[borough],
+                             zero + number // 100, zero + number // 10 % 10, zero + number % 10])
+    return np.ascontiguousarray(chars, dtype=np.uint32).view('U6').ravel().astype(object)
+
+def index_by_code(df, column='dbn', drop=True):
+    """`df` indexed by the codes of its DBN column (which is dropped unless drop=False)"""
+    index = pd.Index(encode(df[column]), name=INDEX_NAME)
+    df = df.drop(column, axis=1) if drop else df.copy()
+    df.index = index
+    return df
+
+def with_dbn_index(df):
+    """A copy of a code-indexed frame, indexed by the DBN strings instead (for display and files)"""
+    df = df.copy()
+    df.index = pd.Index(decode(df.index), name='dbn')
+    return df
+
+def read_csv(data_file, column='dbn', **kwargs):
+    """Read a CSV with a DBN column, indexed by DBN code"""
+    return index_by_code(pd.read_csv(data_file, **kwargs), column)
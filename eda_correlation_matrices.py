@@ -25,8 +25,8 @@ pd.set_option('display.max_rows', 200)
 
 # Get train-test split
 train_data, test_data, train_labels, test_labels = util.read_data()
-# convert train_labels into a dataframe in order to concatenate it
-train_labels_df = pd.DataFrame(train_labels)
+# convert train_labels into a dataframe (on the same DBN code index) in order to concatenate it
+train_labels_df = pd.DataFrame(train_labels, index=train_data.index)
 train_labels_df.columns=['high_registrations']
 
 # Concatenate training features and labels into one dataframe
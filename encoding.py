@@ -0,0 +1,79 @@
+# One hot encoding of factor columns (e.g. zip, district)
+#
+# DummyEncoder learns each factor's categories once on the training data and
+# can then encode any later batch (test data, new schools, ...) the same way.
+# Categories that weren't seen during fit() get all-zero dummies.
+
+import pickle
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class DummyEncoder(object):
+    '''
+        Fit/transform replacement for pd.get_dummies with a fixed vocabulary.
+        transform() returns a dataframe with the factor columns replaced by
+        uint8 dummy columns named "<factor>_<value>" (as pd.get_dummies does),
+        or a scipy CSR matrix if sparse=True.
+    '''
+
+    def __init__(self, factor_cols=['zip', 'district'], sparse=False):
+        self.factor_cols = list(factor_cols)
+        self.sparse = sparse
+
+    def fit(self, data):
+        self.categories_ = {}
+        for f in self.factor_cols:
+            self.categories_[f] = np.sort(data[f].dropna().unique())
+        self.other_cols_ = [c for c in data.columns if c not in self.factor_cols]
+        self.dummy_cols_ = ['{}_{}'.format(f, v)
+                            for f in self.factor_cols for v in self.categories_[f]]
+        return self
+
+    def _dummy_matrix(self, data):
+        """CSR matrix of the dummies: one nonzero per row and factor"""
+        n_rows = data.shape[0]
+        rows, cols = [], []
+        offset = 0
+        for f in self.factor_cols:
+            categories = self.categories_[f]
+            # -1 for missing values and categories not seen in fit()
+            codes = pd.Categorical(data[f], categories=categories).codes
+            known = codes >= 0
+            rows.append(np.nonzero(known)[0])
+            cols.append(codes[known].astype(np.int64) + offset)
+            offset += len(categories)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        values = np.ones(len(rows), dtype=np.uint8)
+        return sparse.csr_matrix((values, (rows, cols)), shape=(n_rows, offset))
+
+    def transform(self, data, sparse_output=None):
+        if sparse_output is None:
+            sparse_output = self.sparse
+        dummies = self._dummy_matrix(data)
+        others = data[self.other_cols_]
+
+        if sparse_output:
+            others_matrix = sparse.csr_matrix(others.values.astype(np.float64))
+            return sparse.hstack([others_matrix, dummies.astype(np.float64)], format='csr')
+
+        dummies_df = pd.DataFrame(dummies.toarray(), index=data.index, columns=self.dummy_cols_)
+        return pd.concat([others, dummies_df], axis=1)
+
+    def fit_transform(self, data, sparse_output=None):
+        return self.fit(data).transform(data, sparse_output)
+
+    def get_feature_names(self):
+        """Column names matching the output of transform()"""
+        return self.other_cols_ + self.dummy_cols_
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
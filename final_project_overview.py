@@ -60,7 +60,7 @@
 # 3. [Class Size Notebook](prep_class_sizes.ipynb)
 # 4. [Gifted & Talented Web Scraping Script](sel_scrape.py)
 # 
-# Next we load the resulting CSV files in a [Merge Notebook](prep_merge.ipynb) to join our cleaned data into one master dataset, resolve issues with missing values, and save as [combined_data_2018-07-30.csv](data_merged/combined_data_2018-07-30.csv).
+# Next we load the resulting CSV files in a [Merge Notebook](prep_merge.ipynb) to join our cleaned data into one master dataset, resolve issues with missing values, and save it as a dated snapshot in data_merged/snapshots (earlier versions were saved as CSVs, the last being [combined_data_2018-07-30.csv](data_merged/combined_data_2018-07-30.csv)).
 
 # ## Highlights of Exploratory Data Analysis
 
@@ -141,12 +141,14 @@ Image(filename='plots/corr_matrix_boroughs.png')
 
 
 import pandas as pd
-# Read final results of each model into separate DataFrames
-df_master = pd.read_csv('data_merged/combined_data_2018-07-30.csv')
-df_logreg = pd.read_csv('results/results.logreg.csv', index_col=0)
-df_knn = pd.read_csv('results/results.knn.csv', index_col=0)
-df_neuralnet = pd.read_csv('results/results.neuralnet.csv', index_col=0)
-df_randomforest = pd.read_csv('results/results.randomforest.csv', index_col=0)
+import dbncode
+import util
+# Read final results of each model into separate DataFrames, all indexed by DBN code so they line up
+df_master = util.read_merged_data()
+df_logreg = dbncode.read_csv('results/results.logreg.csv', index_col=0)
+df_knn = dbncode.read_csv('results/results.knn.csv', index_col=0)
+df_neuralnet = dbncode.read_csv('results/results.neuralnet.csv', index_col=0)
+df_randomforest = dbncode.read_csv('results/results.randomforest.csv', index_col=0)
 
 # Make a new DataFrame of just the scores
 df_scores = pd.concat([df_logreg['score'], df_knn['score'], df_neuralnet['score'], df_randomforest['score']], axis=1)
@@ -159,7 +161,7 @@ df_final = pd.concat([df_master['school_name'], df_master['district'], df_master
 df_final = pd.concat([df_final, df_master['high_registrations']], axis=1)
 df_final.sort_values(by='avg', ascending=False, inplace=True)
 df_final.insert(0, 'rank', range(1,df_final.shape[0]+1))
-df_final.head(20)
+dbncode.with_dbn_index(df_final).head(20)
 
 
 # #### Notes
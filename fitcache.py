@@ -0,0 +1,102 @@
+# On-disk memoization of per-fold fits
+#
+# Fitting the MLP or the forest on 50 folds takes minutes, and re-running a
+# notebook after a cosmetic change would redo all of it.  FitCache stores each
+# fold's predictions (and probabilities) under a key built from the estimator's
+# parameters, the data, and the fold's indices, so only folds whose inputs
+# changed are refitted.  Entries are evicted least-recently-used first once the
+# cache grows past max_bytes.
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'cache_fits'
+
+
+def _sha(*parts):
+    sha = hashlib.sha1()
+    for part in parts:
+        sha.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+    return sha.hexdigest()
+
+def estimator_hash(estimator):
+    """Hash of an estimator's class and (deep) parameters"""
+    params = estimator.get_params(deep=True)
+    items = []
+    for name in sorted(params):
+        value = params[name]
+        if hasattr(value, 'get_params'):
+            # nested estimators' own parameters are already in `params`
+            value = type(value).__name__
+        elif isinstance(value, np.ndarray):
+            value = _sha(value.tobytes())
+        items.append((name, repr(value)))
+    return _sha(type(estimator).__name__, items)
+
+def data_hash(X, y):
+    """Hash of a feature matrix (values, columns and index) and its labels"""
+    if isinstance(X, pd.DataFrame):
+        X_bytes = pd.util.hash_pandas_object(X, index=True).values.tobytes()
+        X_bytes += repr(list(X.columns)).encode('utf-8')
+    else:
+        X_bytes = np.ascontiguousarray(X).tobytes()
+    return _sha(X_bytes, np.ascontiguousarray(y).tobytes())
+
+
+class FitCache(object):
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=500 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fold_keys(self, estimator, X, y, fold_indices, with_proba=False):
+        """One key per fold: estimator params + data + the fold's train/test indices"""
+        prefix = _sha(estimator_hash(estimator), data_hash(X, y), with_proba)
+        return [_sha(prefix, np.asarray(train).tobytes(), np.asarray(test).tobytes())
+                for train, test in fold_indices]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """(labels, proba or None) for a cached fold, or None on a miss"""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                labels = entry['labels']
+                proba = entry['proba'] if 'proba' in entry.files else None
+        except (FileNotFoundError, IOError, ValueError):
+            return None
+        # touch the entry so eviction sees it as recently used
+        os.utime(path, None)
+        return labels, proba
+
+    def put(self, key, labels, proba=None):
+        arrays = {'labels': labels}
+        if proba is not None:
+            arrays['proba'] = proba
+        tmp_path = self._path(key) + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,75 @@
+# Persisted train/test splits and repeated k-fold plans
+#
+# Our stratified splits only depend on the labels (and the split parameters),
+# so we compute them once per label vector and save the indices as compact
+# int32 arrays under cache_folds/.  Every script that loads the same dataset
+# then reuses the exact same train/test split and the same 5x10 folds.
+
+import hashlib
+import os
+import numpy as np
+from sklearn.model_selection import RepeatedStratifiedKFold
+from sklearn.model_selection import train_test_split
+
+FOLD_DIR = 'cache_folds'
+N_SPLITS = 5
+N_REPEATS = 10
+
+
+def labels_hash(y, **params):
+    """Hash of a label vector plus the parameters used to split it"""
+    sha = hashlib.sha1(np.ascontiguousarray(y, dtype=np.int8).tobytes())
+    sha.update(repr(sorted(params.items())).encode('utf-8'))
+    return sha.hexdigest()
+
+def _save(path, **arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def split_plan(y, test_size, random_state, cache_dir=FOLD_DIR):
+    '''
+        Positional (train_idx, test_idx) for a stratified train/test split of
+        labels `y`; same rows as train_test_split(..., stratify=y) would pick.
+    '''
+    key = labels_hash(y, kind='split', test_size=test_size, random_state=random_state)
+    path = os.path.join(cache_dir, 'split_%s.npz' % key)
+    try:
+        with np.load(path) as plan:
+            return plan['train_idx'], plan['test_idx']
+    except FileNotFoundError:
+        pass
+
+    train_idx, test_idx = train_test_split(np.arange(len(y), dtype=np.int32),
+                                           test_size=test_size, random_state=random_state,
+                                           stratify=y)
+    _save(path, train_idx=train_idx, test_idx=test_idx)
+    return train_idx, test_idx
+
+def fold_plan(y, n_splits=N_SPLITS, n_repeats=N_REPEATS, random_state=207, cache_dir=FOLD_DIR):
+    '''
+        List of (train, test) positional index arrays, identical to
+        RepeatedStratifiedKFold(n_splits, n_repeats, random_state).split(X, y).
+        Only the test folds are stored (back to back, int32); each training
+        set is the sorted complement of its test fold, as in StratifiedKFold.
+    '''
+    key = labels_hash(y, kind='rskf', n_splits=n_splits, n_repeats=n_repeats,
+                      random_state=random_state)
+    path = os.path.join(cache_dir, 'folds_%s.npz' % key)
+    try:
+        with np.load(path) as plan:
+            test_folds = np.split(plan['test_idx'], plan['offsets'][1:-1])
+    except FileNotFoundError:
+        rskf = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats,
+                                       random_state=random_state)
+        test_folds = [test.astype(np.int32) for _, test in rskf.split(np.zeros(len(y)), y)]
+        offsets = np.cumsum([0] + [len(test) for test in test_folds]).astype(np.int32)
+        _save(path, test_idx=np.concatenate(test_folds), offsets=offsets)
+
+    folds = []
+    for test in test_folds:
+        in_test = np.zeros(len(y), dtype=bool)
+        in_test[test] = True
+        folds.append((np.nonzero(~in_test)[0].astype(np.int32), test))
+    return folds
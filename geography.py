@@ -0,0 +1,61 @@
+# Zip code geography for NYC schools
+#
+# Borough membership used to be derived with one `zip in <list>` scan per row
+# and per borough.  Instead we build a single lookup array indexed by zip code
+# once, so the borough of every school comes from one array take, and all the
+# indicator columns from one comparison against the borough codes.
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+BOROUGH_ZIPS = OrderedDict([
+    ('bronx', [10453, 10457, 10460, 10458, 10467, 10468, 10451, 10452, 10456, 10454, 10455, 10459, 10474, 10463, 10471, 10466, 10469, 10470, 10475, 10461, 10462, 10464, 10465, 10472, 10473]),
+    ('brooklyn', [11212, 11213, 11216, 11233, 11238, 11209, 11214, 11228, 11204, 11218, 11219, 11230, 11234, 11236, 11239, 11223, 11224, 11229, 11235, 11201, 11205, 11215, 11217, 11231, 11203, 11210, 11225, 11226, 11207, 11208, 11211, 11222, 11220, 11232, 11206, 11221, 11237]),
+    ('manhattan', [10026, 10027, 10030, 10037, 10039, 10001, 10011, 10018, 10019, 10020, 10036, 10029, 10035, 10010, 10016, 10017, 10022, 10012, 10013, 10014, 10004, 10005, 10006, 10007, 10038, 10280, 10002, 10003, 10009, 10021, 10028, 10044, 10065, 10075, 10128, 10023, 10024, 10025, 10031, 10032, 10033, 10034, 10040]),
+    ('queens', [11361, 11362, 11363, 11364, 11354, 11355, 11356, 11357, 11358, 11359, 11360, 11365, 11366, 11367, 11412, 11423, 11432, 11433, 11434, 11435, 11436, 11101, 11102, 11103, 11104, 11105, 11106, 11374, 11375, 11379, 11385, 11691, 11692, 11693, 11694, 11695, 11697, 11004, 11005, 11411, 11413, 11422, 11426, 11427, 11428, 11429, 11414, 11415, 11416, 11417, 11418, 11419, 11420, 11421, 11368, 11369, 11370, 11372, 11373, 11377, 11378]),
+    ('staten', [10302, 10303, 10310, 10306, 10307, 10308, 10309, 10312, 10301, 10304, 10305, 10314]),
+])
+
+BOROUGHS = list(BOROUGH_ZIPS)
+
+
+def _zip_lookup(borough_zips=BOROUGH_ZIPS):
+    """Array mapping zip code -> borough number (position in borough_zips), -1 if unknown"""
+    lookup = np.full(max(max(zips) for zips in borough_zips.values()) + 1, -1, dtype=np.int8)
+    for code, zips in enumerate(borough_zips.values()):
+        lookup[zips] = code
+    return lookup
+
+ZIP_LOOKUP = _zip_lookup()
+
+
+def _lookup(values, lookup):
+    values = pd.to_numeric(pd.Series(values), errors='coerce').values
+    known = ~np.isnan(values) & (values >= 0) & (values < len(lookup))
+    codes = np.full(len(values), -1, dtype=np.int8)
+    codes[known] = lookup[values[known].astype(np.int64)]
+    return codes
+
+def borough_codes(zips, lookup=ZIP_LOOKUP):
+    '''
+        Borough number (index into BOROUGHS) of each zip code, -1 for zips
+        outside the five boroughs or missing.  Categorical columns are looked
+        up once per category.
+    '''
+    if hasattr(zips, 'cat'):
+        category_codes = np.append(_lookup(zips.cat.categories, lookup), np.int8(-1))
+        # missing values have category code -1, which picks the appended -1
+        return category_codes[zips.cat.codes.values]
+    return _lookup(zips, lookup)
+
+def borough_names(zips, lookup=ZIP_LOOKUP):
+    """Borough of each zip code as a categorical (NaN when unknown)"""
+    return pd.Categorical.from_codes(borough_codes(zips, lookup), BOROUGHS)
+
+def borough_indicators(zips, prefix='in_', lookup=ZIP_LOOKUP):
+    """0/1 dataframe with one column per borough (in_bronx, in_brooklyn, ...)"""
+    codes = borough_codes(zips, lookup)
+    indicators = (codes[:, np.newaxis] == np.arange(len(BOROUGHS))).astype(int)
+    return pd.DataFrame(indicators, index=getattr(zips, 'index', None),
+                        columns=[prefix + b for b in BOROUGHS])
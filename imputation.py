@@ -0,0 +1,98 @@
+# Mean imputation that can sit inside a model pipeline without leaking
+#
+# Imputing column means on the whole dataset before splitting lets every
+# held-out fold see its own values through the means.  FoldMeanImputer learns
+# its means from the rows it is fitted on, so it belongs inside the pipeline.
+# To keep that cheap across the 50 RSKF folds and grid searches, ColumnStats
+# holds per-column sums and counts over the whole dataset, computed once; a
+# fold's training means are then the totals minus the held-out rows'
+# contribution, without summing over the training rows again.
+#
+#     stats = ColumnStats(train_data[numeric_cols])
+#     pipeline = make_pipeline(FoldMeanImputer(stats), StandardScaler(), KNeighborsClassifier())
+
+import hashlib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+class ColumnStats(object):
+    '''
+        Per-column sums and non-missing counts of a (numeric) dataframe, which
+        must have a unique index -- the DBN codes from util.read_data.  Rows
+        are matched to the data a FoldMeanImputer is fitted on by that index.
+    '''
+
+    def __init__(self, data):
+        if not data.index.is_unique:
+            raise ValueError('ColumnStats needs a unique index')
+        self.index = data.index
+        self.columns = data.columns
+        self.values = data.values.astype(np.float64)
+        observed = ~np.isnan(self.values)
+        self.sums = np.where(observed, self.values, 0).sum(axis=0)
+        self.counts = observed.sum(axis=0)
+        self.key = hashlib.sha1(pd.util.hash_pandas_object(data, index=True).values.tobytes()
+                                + repr(list(data.columns)).encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        # stable across runs, so fitcache keys of pipelines holding stats are too
+        return 'ColumnStats(%s)' % self.key
+
+    def __deepcopy__(self, memo):
+        # never modified after construction, so clone()d pipelines can share it
+        return self
+
+    def means_without_heldout(self, data):
+        '''
+            Column means over the rows of `data`, from the cached totals minus
+            the rows that aren't in `data`.  Returns None if `data` has rows or
+            columns these stats don't cover.
+        '''
+        cols = self.columns.get_indexer(data.columns)
+        in_data = self.index.isin(data.index)
+        if (cols < 0).any() or in_data.sum() != len(data) or not data.index.is_unique:
+            return None
+
+        heldout = self.values[~in_data][:, cols]
+        observed = ~np.isnan(heldout)
+        sums = self.sums[cols] - np.where(observed, heldout, 0).sum(axis=0)
+        counts = self.counts[cols] - observed.sum(axis=0)
+        return _means(sums, counts)
+
+
+def _means(sums, counts):
+    # columns with no values at all get a mean of 0
+    return np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+
+class FoldMeanImputer(BaseEstimator, TransformerMixin):
+    '''
+        Fill missing values with the column means of the training rows.  With
+        ColumnStats built from the full dataset, fitting on a dataframe whose
+        rows (by index) and columns the stats cover uses the cached totals;
+        anything else (e.g. a plain array) is averaged directly.
+    '''
+
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    def fit(self, X, y=None):
+        means = None
+        if self.stats is not None and isinstance(X, pd.DataFrame):
+            means = self.stats.means_without_heldout(X)
+        if means is None:
+            values = np.asarray(X, dtype=np.float64)
+            observed = ~np.isnan(values)
+            means = _means(np.where(observed, values, 0).sum(axis=0), observed.sum(axis=0))
+        self.means_ = means
+        return self
+
+    def transform(self, X):
+        if isinstance(X, pd.DataFrame):
+            return X.fillna(pd.Series(self.means_, index=X.columns))
+        values = np.array(X, dtype=np.float64)
+        missing = np.isnan(values)
+        values[missing] = np.take(self.means_, np.nonzero(missing)[1])
+        return values
@@ -0,0 +1,75 @@
+# Multi-way inner joins of the cleaned datasets
+#
+# prep_merge used to chain one join per source, then repeat the whole chain
+# for each variant of the merged dataset, and recompute isnull() for every
+# statistic it printed.  Here each source is lined up against the first
+# (base) source once -- its row positions and its null mask -- and every
+# variant is cut out of those with a single positional take per source, so
+# the work grows with the number of sources rather than sources x variants.
+
+from collections import namedtuple, OrderedDict
+import numpy as np
+import pandas as pd
+
+# shape and null statistics of a merged frame
+NullProfile = namedtuple('NullProfile', ['shape', 'total_nulls', 'pct_null', 'column_nulls', 'row_nulls'])
+
+
+def _aligned_positions(sources):
+    '''
+        For each source, the row position of each base row in that source
+        (-1 where it's missing), along with the source's null mask.
+    '''
+    base_index = next(iter(sources.values())).index
+    aligned = OrderedDict()
+    for name, df in sources.items():
+        if not df.index.is_unique:
+            raise ValueError('duplicated index values in %s' % name)
+        aligned[name] = (df.index.get_indexer(base_index), df.isnull().values)
+    return base_index, aligned
+
+def _profile(index, columns, nulls):
+    column_nulls = pd.Series(nulls.sum(axis=0), index=columns)
+    row_nulls = pd.Series(nulls.sum(axis=1), index=index)
+    total = int(column_nulls.sum())
+    return NullProfile(shape=nulls.shape,
+                       total_nulls=total,
+                       pct_null=100 * total / max(nulls.size, 1),
+                       column_nulls=column_nulls[column_nulls > 0].sort_values(ascending=False),
+                       row_nulls=row_nulls[row_nulls > 0].sort_values(ascending=False))
+
+def merge_variants(sources, variants):
+    '''
+        inputs: sources (ordered dict of name -> dataframe, all indexed by DBN code;
+                rows come out in the order of the first source),
+                variants (ordered dict of variant name -> list of source names to join)
+        returns: ordered dict of variant name -> (merged dataframe, NullProfile), where
+                 each merged dataframe is the inner join of its sources, columns in
+                 source order, like chaining df.join(other, how='inner')
+    '''
+    base_index, aligned = _aligned_positions(sources)
+
+    merged = OrderedDict()
+    for variant, names in variants.items():
+        columns = [c for name in names for c in sources[name].columns]
+        if len(set(columns)) != len(columns):
+            raise ValueError('sources of %s share column names' % variant)
+
+        # base rows present in every source of this variant
+        rows = np.ones(len(base_index), dtype=bool)
+        for name in names:
+            rows &= aligned[name][0] >= 0
+
+        index = base_index[rows]
+        blocks = []
+        null_blocks = []
+        for name in names:
+            positions, nulls = aligned[name]
+            block = sources[name].iloc[positions[rows]]
+            block.index = index
+            blocks.append(block)
+            null_blocks.append(nulls[positions[rows]])
+
+        df = pd.concat(blocks, axis=1)
+        merged[variant] = (df, _profile(index, df.columns, np.hstack(null_blocks)))
+    return merged
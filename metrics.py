@@ -0,0 +1,55 @@
+# Bootstrap confidence intervals for accuracy and F1
+#
+# Rather than mean +/- 1.96 std over five fold scores, we resample the
+# out-of-fold predictions themselves.  All resamples are drawn as one
+# (resamples x observations) index matrix, and the confusion counts of every
+# resample come from a single bincount, so 10,000 resamples take milliseconds.
+
+import numpy as np
+
+
+def confusion_counts(y_true, y_pred, resample_idx=None):
+    '''
+        (tn, fp, fn, tp) counts for binary labels, one row per resample
+        (row i counts the observations listed in resample_idx[i]).
+    '''
+    codes = 2 * np.asarray(y_true, dtype=np.int64) + np.asarray(y_pred, dtype=np.int64)
+    if resample_idx is None:
+        return np.bincount(codes, minlength=4)[np.newaxis, :]
+
+    n_resamples = resample_idx.shape[0]
+    # offset each resample's codes so one bincount counts all of them separately
+    offsets = 4 * np.arange(n_resamples, dtype=np.int64)[:, np.newaxis]
+    counts = np.bincount((codes[resample_idx] + offsets).ravel(), minlength=4 * n_resamples)
+    return counts.reshape(n_resamples, 4)
+
+def scores_from_counts(counts):
+    """Accuracy and F1 for each row of (tn, fp, fn, tp) counts"""
+    tn, fp, fn, tp = counts.T.astype(float)
+    accuracy = (tp + tn) / counts.sum(axis=1)
+    # F1 is 0 when there are no positives at all, as in sklearn
+    denominator = 2 * tp + fp + fn
+    f1 = np.where(denominator > 0, 2 * tp / np.maximum(denominator, 1), 0.0)
+    return accuracy, f1
+
+def bootstrap_scores(y_true, y_pred, n_resamples=10000, random_state=207):
+    """Accuracy and F1 of n_resamples bootstrap resamples of the predictions"""
+    n = len(y_true)
+    rng = np.random.RandomState(random_state)
+    resample_idx = rng.randint(0, n, size=(n_resamples, n)).astype(np.int32)
+    return scores_from_counts(confusion_counts(y_true, y_pred, resample_idx))
+
+def bootstrap_ci(y_true, y_pred, n_resamples=10000, interval=95, random_state=207):
+    '''
+        returns: {'accuracy': (score, low, high), 'f1': (score, low, high)}, where
+                 score is computed on all predictions and (low, high) is the
+                 percentile bootstrap interval
+    '''
+    accuracy, f1 = scores_from_counts(confusion_counts(y_true, y_pred))
+    boot_accuracy, boot_f1 = bootstrap_scores(y_true, y_pred, n_resamples, random_state)
+    tail = (100 - interval) / 2.0
+    results = {}
+    for name, score, boot in [('accuracy', accuracy[0], boot_accuracy), ('f1', f1[0], boot_f1)]:
+        low, high = np.percentile(boot, [tail, 100 - tail])
+        results[name] = (score, low, high)
+    return results
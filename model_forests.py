@@ -23,9 +23,10 @@ import graphviz
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import f1_score
 from sklearn.tree import export_graphviz
-from sklearn.model_selection import GridSearchCV, cross_validate, RepeatedStratifiedKFold
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, RepeatedStratifiedKFold
 from sklearn.preprocessing import MinMaxScaler
-from util import our_train_test_split, read_data, get_dummies,     print_cv_results, run_model_get_ordered_predictions, create_passnyc_list
+from util import our_train_test_split, read_data, get_dummies,     print_cv_results, cross_validate_folds, run_model_get_ordered_predictions, create_passnyc_list
 import pickle
 
 # set default options
@@ -166,23 +167,10 @@ for param, val in best_params.items():
 
 print("\n")
 
-winning_cv_results = cv_results[cv_results['rank_test_f1'] == 1].iloc[1,:]
-
-# display accuracy with 95% confidence interval
-winning_mean_accuracy = winning_cv_results['mean_test_accuracy']
-std_accuracy = winning_cv_results['std_test_accuracy']
-print('With %d-fold cross-validation,\nAccuracy is: %.3f (95%% CI from %.3f to %.3f).' %
-          (KFOLDS, winning_mean_accuracy,
-           float(winning_mean_accuracy - 1.96 * std_accuracy),
-           float(winning_mean_accuracy + 1.96 * std_accuracy)))
-
-# display F1 score with 95% confidence interval
-winning_mean_f1 = winning_cv_results['mean_test_f1']
-std_f1 = winning_cv_results['std_test_f1']
-print('The F1 score is: %.3f (95%% CI from %.3f to %.3f).' %
-          (winning_mean_f1,
-           float(winning_mean_f1 - 1.96 * std_f1),
-           float(winning_mean_f1 + 1.96 * std_f1)))
+# Cross-validate the winning parameters on the same folds as the grid search,
+# keeping the out-of-fold predictions so we can bootstrap 95% confidence intervals
+cv_scores = cross_validate_folds(clone(best_forest), train_prepped, train_labels, k_folds=KFOLDS)
+print_cv_results(cv_scores)
 
 
 # ### Analyzing our Top 10 Features
@@ -27,7 +27,7 @@ import pandas as pd
 from sklearn.neighbors import KNeighborsClassifier
 import sklearn.metrics as metrics
 from sklearn.metrics import classification_report
-from sklearn.model_selection import train_test_split, cross_validate, GridSearchCV
+from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.ensemble import ExtraTreesClassifier
 from sklearn.pipeline import make_pipeline
 from sklearn.feature_selection import SelectFromModel
@@ -126,7 +126,7 @@ scaler = StandardScaler().fit(perf_train_data_nonull)
 rescaledX = scaler.transform(perf_train_data_nonull)
 # Do k-fold cross-validation, collecting both "test" accuracy and F1 
 clf = KNeighborsClassifier(n_neighbors=best_k_all_features)
-cv_scores = cross_validate(clf, rescaledX, y, cv=k_folds, scoring=['accuracy', 'f1'])
+cv_scores = util.cross_validate_folds(clf, rescaledX, y, k_folds=k_folds)
 util.print_cv_results(cv_scores)
 
 
@@ -181,7 +181,7 @@ rescaledX_sel = scaler.transform(perf_train_data_nonull_sel)
 clf = KNeighborsClassifier(n_neighbors=best_k_some_features)
 
 # Do k-fold cross-validation, collecting both "test" accuracy and F1 
-cv_scores = cross_validate(clf, rescaledX_sel, y, cv=k_folds, scoring=['accuracy','f1'])
+cv_scores = util.cross_validate_folds(clf, rescaledX_sel, y, k_folds=k_folds)
 util.print_cv_results(cv_scores)
 
 
@@ -240,7 +240,7 @@ pipeline = make_pipeline(StandardScaler(),
                          PCA(random_state=207, n_components=best_pca_components),
                          KNeighborsClassifier(n_neighbors=best_k_with_pca))
 
-cv_scores = cross_validate(pipeline, perf_train_data_nonull, train_labels, cv=k_folds, scoring=['accuracy', 'f1'])
+cv_scores = util.cross_validate_folds(pipeline, perf_train_data_nonull, train_labels, k_folds=k_folds)
 util.print_cv_results(cv_scores)
 
 
@@ -150,12 +150,12 @@ print('Best C:', best_c)
 # In[40]:
 
 
-from sklearn.model_selection import cross_val_score, cross_validate
+from sklearn.model_selection import cross_val_score
 from sklearn.pipeline import make_pipeline
 
 pipe = make_pipeline(StandardScaler(), LogisticRegression(C=best_c, penalty=best_penalty, random_state=207))
 k_folds = 5
-cv_scores = cross_validate(pipe, train_data, train_labels, cv=k_folds, scoring=['accuracy','f1'])
+cv_scores = util.cross_validate_folds(pipe, train_data, train_labels, k_folds=k_folds)
 cv_f1 = cv_scores['test_f1'].mean()
 util.print_cv_results(cv_scores)
 
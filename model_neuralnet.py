@@ -20,7 +20,7 @@ import util
 
 from sklearn.decomposition import PCA
 from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.model_selection import cross_val_score, cross_validate, RepeatedStratifiedKFold
+from sklearn.model_selection import cross_val_score, RepeatedStratifiedKFold
 from sklearn.neural_network import MLPClassifier
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
@@ -86,7 +86,7 @@ def estimate_mlp(train_data, train_labels, n_pca=None,
                                                max_iter=max_iter, random_state=207))
 
     # Do k-fold cross-validation, collecting both "test" accuracy and F1 
-    cv_scores = cross_validate(pipeline, train_data, train_labels, cv=k_folds, scoring=['accuracy','f1'])
+    cv_scores = util.cross_validate_folds(pipeline, train_data, train_labels, k_folds=k_folds)
     if print_results:
         util.print_cv_results(cv_scores)
         
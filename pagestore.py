@@ -0,0 +1,219 @@
+# Compressed single-file store for scraped pages
+#
+# Instead of one HTML file per school, pages are appended to one archive as
+# individually zlib-compressed records, and an index maps each key (DBN) to
+# its record's offset.  A single page is read with one seek and decompressed
+# on its own; iterating walks the archive in order, one page at a time.
+# Storing a page again appends a new record and repoints the index (compact()
+# drops the stale ones).  Each record starts with a header carrying its key
+# and a CRC of its contents, so the index can always be rebuilt from the
+# archive itself; a record left half-written by a crash is cut off then.
+#
+# Usage: python pagestore.py schoolinfo schoolinfo.pages    (import a page directory)
+
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+
+ARCHIVE = 'schoolinfo.pages'
+
+# magic, key length, compressed length, raw length, CRC-32 of key + compressed page
+_HEADER = struct.Struct('>4sHIII')
+_MAGIC = b'PGS2'
+
+
+def _crc(encoded_key, compressed):
+    return zlib.crc32(compressed, zlib.crc32(encoded_key))
+
+def _read_entry(f, key, entry):
+    encoded_key = key.encode('utf-8')
+    f.seek(entry['offset'] + _HEADER.size + len(encoded_key))
+    compressed = f.read(entry['length'])
+    if len(compressed) != entry['length'] or _crc(encoded_key, compressed) != entry['crc']:
+        raise ValueError('stored page %s is damaged' % key)
+    return zlib.decompress(compressed)
+
+def read_entries(path, entries):
+    '''
+        Stream (key, body) for (key, index entry) pairs taken from a store's
+        index, reading the archive directly.  This is how worker processes
+        read their pages: they never load (or rebuild) the index themselves.
+    '''
+    with open(path, 'rb') as f:
+        for key, entry in entries:
+            yield key, _read_entry(f, key, entry)
+
+
+class PageStore(object):
+
+    def __init__(self, path=ARCHIVE, level=9):
+        self.path = path
+        self.level = level
+        self.index_path = path + '.idx'
+        if not os.path.exists(path):
+            open(path, 'ab').close()
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self.rebuild_index()
+        # an index older than the archive (e.g. a crash between the two writes) is rebuilt
+        if index.get('archive_size') != os.path.getsize(self.path):
+            return self.rebuild_index()
+        return index['entries']
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'archive_size': os.path.getsize(self.path), 'entries': self.index},
+                      f, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def _record_at(self, f, offset):
+        """(key, index entry, end offset) of the record at `offset`, or None if it isn't intact"""
+        f.seek(offset)
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        magic, key_length, compressed_length, raw_length, crc = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            return None
+        encoded_key = f.read(key_length)
+        compressed = f.read(compressed_length)
+        if (len(encoded_key) < key_length or len(compressed) < compressed_length
+                or _crc(encoded_key, compressed) != crc):
+            return None
+        entry = {'offset': offset, 'length': compressed_length, 'size': raw_length,
+                 'crc': crc, 'sha1': None}
+        return encoded_key.decode('utf-8'), entry, f.tell()
+
+    def _torn_tail(self, f, offset, size):
+        """Whether the bad record at `offset` is the unfinished last write"""
+        f.seek(offset)
+        tail = f.read()
+        if len(tail) < _HEADER.size or not tail.strip(b'\0'):
+            # a partial header, or space allocated but never written
+            return True
+        magic, key_length, compressed_length, _, _ = _HEADER.unpack(tail[:_HEADER.size])
+        # a record that reaches (or would reach past) the end of the file
+        return magic == _MAGIC and offset + _HEADER.size + key_length + compressed_length >= size
+
+    def rebuild_index(self):
+        '''
+            Index every record in the archive (later records of a key win).
+            A damaged record at the end, as a crash in the middle of a write
+            leaves, is truncated away; any other damage raises ValueError
+            rather than dropping pages.
+        '''
+        entries = {}
+        size = os.path.getsize(self.path)
+        with open(self.path, 'r+b') as f:
+            offset = 0
+            while offset < size:
+                record = self._record_at(f, offset)
+                if record is None:
+                    if not self._torn_tail(f, offset, size):
+                        raise ValueError('%s is corrupt at offset %d' % (self.path, offset))
+                    print('%s: dropping %d bytes of an incomplete record' % (self.path, size - offset))
+                    f.truncate(offset)
+                    break
+                key, entries[key], offset = record
+        self.index = entries
+        self._save_index()
+        return entries
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        """Keys in archive order"""
+        return sorted(self.index, key=lambda key: self.index[key]['offset'])
+
+    def entries(self, keys=None):
+        """(key, index entry) pairs in archive order, for all keys or just `keys`"""
+        wanted = None if keys is None else set(keys)
+        return [(key, self.index[key]) for key in self.keys() if wanted is None or key in wanted]
+
+    def get(self, key):
+        """The page stored under `key` (bytes); only that record is read and decompressed"""
+        with open(self.path, 'rb') as f:
+            return _read_entry(f, key, self.index[key])
+
+    def sha1(self, key):
+        """SHA-1 of a stored page, without decompressing it if it's already known"""
+        entry = self.index[key]
+        if entry['sha1'] is None:
+            entry['sha1'] = hashlib.sha1(self.get(key)).hexdigest()
+        return entry['sha1']
+
+    def put(self, key, body, sync=True):
+        self.put_many([(key, body)], sync)
+
+    def put_many(self, pages, sync=True):
+        '''
+            Append (key, body) pages, then write the index once.  With
+            sync=False the index is only written by flush(); if that never
+            happens it is rebuilt from the archive on the next open.
+        '''
+        with open(self.path, 'ab') as f:
+            for key, body in pages:
+                encoded_key = key.encode('utf-8')
+                compressed = zlib.compress(body, self.level)
+                crc = _crc(encoded_key, compressed)
+                offset = f.tell()
+                f.write(_HEADER.pack(_MAGIC, len(encoded_key), len(compressed), len(body), crc))
+                f.write(encoded_key)
+                f.write(compressed)
+                self.index[key] = {'offset': offset, 'length': len(compressed), 'size': len(body),
+                                   'crc': crc, 'sha1': hashlib.sha1(body).hexdigest()}
+        if sync:
+            self._save_index()
+
+    def flush(self):
+        self._save_index()
+
+    def items(self, keys=None):
+        '''
+            Stream (key, body) pairs, decompressing one page at a time.  Pages
+            are read in archive order, so the file is scanned sequentially.
+        '''
+        return read_entries(self.path, self.entries(keys))
+
+    def compact(self):
+        """Rewrite the archive with only the current record of each key"""
+        for leftover in (self.path + '.compact', self.path + '.compact.idx'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        tmp = PageStore(self.path + '.compact', self.level)
+        tmp.put_many(self.items())
+        tmp_index = tmp.index
+        os.replace(tmp.path, self.path)
+        os.remove(tmp.index_path)
+        self.index = tmp_index
+        self._save_index()
+
+    def import_dir(self, page_dir, suffix='.html'):
+        """Add every <key><suffix> file of a page directory"""
+        def pages():
+            for name in sorted(os.listdir(page_dir)):
+                if name.endswith(suffix):
+                    with open(os.path.join(page_dir, name), 'rb') as f:
+                        yield name[:-len(suffix)], f.read()
+        self.put_many(pages())
+
+
+if __name__ == '__main__':
+    page_dir = sys.argv[1] if len(sys.argv) > 1 else 'schoolinfo'
+    store = PageStore(sys.argv[2] if len(sys.argv) > 2 else ARCHIVE)
+    store.import_dir(page_dir)
+    print('%d pages, %.1f MB -> %.1f MB' % (len(store), sum(e['size'] for e in store.index.values()) / 2**20,
+                                           os.path.getsize(store.path) / 2**20))
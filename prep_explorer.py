@@ -24,6 +24,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import pandas as pd
+import schema
+import geography
 
 # set default options
 pd.set_option('display.max_columns', None)
@@ -36,7 +38,9 @@ get_ipython().magic('matplotlib inline')
 
 
 # load dataset from CSV
-raw_se_2016 = pd.read_csv('data_raw/2016_school_explorer.csv')
+# only the columns declared in our schema are read, already converted to compact dtypes
+raw_se_2016 = schema.read_with_schema('data_raw/2016_school_explorer.csv', schema.EXPLORER_SCHEMA,
+                                      extra_columns=['Grades'])
 raw_se_2016.info()
 
 
@@ -61,39 +65,8 @@ se_2016_trimmed.info()
 # In[16]:
 
 
-features_to_keep = ['Location Code', 'School Name', 'District','Zip', 'Community School?',
-                    'Economic Need Index', 'School Income Estimate',
-                    'Percent ELL', 'Percent Asian', 'Percent Black', 'Percent Hispanic',
-                    'Percent Black / Hispanic', 'Percent White', 'Student Attendance Rate',
-                    'Percent of Students Chronically Absent',
-                    'Rigorous Instruction %','Rigorous Instruction Rating',
-                    'Collaborative Teachers %','Collaborative Teachers Rating',
-                    'Supportive Environment %','Supportive Environment Rating',
-                    'Effective School Leadership %','Effective School Leadership Rating',
-                    'Strong Family-Community Ties %','Strong Family-Community Ties Rating',
-                    'Trust %', 'Trust Rating', 
-                    'Student Achievement Rating', 'Average ELA Proficiency',
-                    'Average Math Proficiency', 
-                    'Grade 7 ELA - All Students Tested',
-                    'Grade 7 ELA 4s - All Students',
-                    'Grade 7 ELA 4s - American Indian or Alaska Native',
-                    'Grade 7 ELA 4s - Black or African American',
-                    'Grade 7 ELA 4s - Hispanic or Latino',
-                    'Grade 7 ELA 4s - Asian or Pacific Islander',
-                    'Grade 7 ELA 4s - White', 'Grade 7 ELA 4s - Multiracial',
-                    'Grade 7 ELA 4s - Limited English Proficient',
-                    'Grade 7 ELA 4s - Economically Disadvantaged',
-                    'Grade 7 Math - All Students Tested', 
-                    'Grade 7 Math 4s - All Students',
-                    'Grade 7 Math 4s - American Indian or Alaska Native',
-                    'Grade 7 Math 4s - Black or African American',
-                    'Grade 7 Math 4s - Hispanic or Latino',
-                    'Grade 7 Math 4s - Asian or Pacific Islander',
-                    'Grade 7 Math 4s - White',
-                    'Grade 7 Math 4s - Multiracial',
-                    'Grade 7 Math 4s - Limited English Proficient',
-                    'Grade 7 Math 4s - Economically Disadvantaged'
-]
+# the columns we keep are the ones declared in schema.EXPLORER_SCHEMA
+features_to_keep = list(schema.EXPLORER_SCHEMA)
 se_2016_trimmed = se_2016_trimmed[features_to_keep]
 se_2016_trimmed.info()
 
@@ -125,18 +98,9 @@ se_2016_derived['sie_provided'] = se_2016_derived['sie_provided'].astype(int)
 # While zip codes might be too granular on their own to signal
 # commonalities between schools, we see if grouping by borough
 # provides more shared information, and allow the 'district' variable
-# to signal more fine-grained locality.
-bronx_zips = [10453, 10457, 10460, 10458, 10467, 10468, 10451, 10452, 10456, 10454, 10455, 10459, 10474, 10463, 10471, 10466, 10469, 10470, 10475, 10461, 10462,10464, 10465, 10472, 10473]
-brooklyn_zips = [11212, 11213, 11216, 11233, 11238, 11209, 11214, 11228, 11204, 11218, 11219, 11230, 11234, 11236, 11239, 11223, 11224, 11229, 11235, 11201, 11205, 11215, 11217, 11231, 11203, 11210, 11225, 11226, 11207, 11208, 11211, 11222, 11220, 11232, 11206, 11221, 11237]
-manhattan_zips = [10026, 10027, 10030, 10037, 10039, 10001, 10011, 10018, 10019, 10020, 10036, 10029, 10035, 10010, 10016, 10017, 10022, 10012, 10013, 10014, 10004, 10005, 10006, 10007, 10038, 10280, 10002, 10003, 10009, 10021, 10028, 10044, 10065, 10075, 10128, 10023, 10024, 10025, 10031, 10032, 10033, 10034, 10040]
-queens_zips = [11361, 11362, 11363, 11364, 11354, 11355, 11356, 11357, 11358, 11359, 11360, 11365, 11366, 11367, 11412, 11423, 11432, 11433, 11434, 11435, 11436, 11101, 11102, 11103, 11104, 11105, 11106, 11374, 11375, 11379, 11385, 11691, 11692, 11693, 11694, 11695, 11697, 11004, 11005, 11411, 11413, 11422, 11426, 11427, 11428, 11429, 11414, 11415, 11416, 11417, 11418, 11419, 11420, 11421, 11368, 11369, 11370, 11372, 11373, 11377, 11378]
-staten_zips = [10302, 10303, 10310, 10306, 10307, 10308, 10309, 10312,10301, 10304, 10305,10314]
-
-se_2016_derived['in_bronx'] = se_2016_derived['Zip'].apply((lambda zip: int(zip in bronx_zips)))
-se_2016_derived['in_brooklyn'] = se_2016_derived['Zip'].apply((lambda zip: int(zip in brooklyn_zips)))
-se_2016_derived['in_manhattan'] = se_2016_derived['Zip'].apply((lambda zip: int(zip in manhattan_zips)))
-se_2016_derived['in_queens'] = se_2016_derived['Zip'].apply((lambda zip: int(zip in queens_zips)))
-se_2016_derived['in_staten'] = se_2016_derived['Zip'].apply((lambda zip: int(zip in staten_zips)))
+# to signal more fine-grained locality.  geography.BOROUGH_ZIPS holds
+# the zip codes of each borough.
+se_2016_derived = se_2016_derived.join(geography.borough_indicators(se_2016_derived['Zip']))
 
 print("Shape after derived columns:",se_2016_derived.shape)
 
@@ -164,54 +128,8 @@ se_2016_renamed.rename(columns={"Location Code":"DBN"}, inplace=True)
 # Utility functions 
 import util
 
-# Remove percent
-percent_columns = [
-    'Percent ELL',
-    'Percent Asian',
-    'Percent Black',
-    'Percent Hispanic',
-    'Percent Black / Hispanic',
-    'Percent White',
-    'Student Attendance Rate',
-    'Percent of Students Chronically Absent',
-    'Rigorous Instruction %',
-    'Collaborative Teachers %',
-    'Supportive Environment %',
-    'Effective School Leadership %',
-    'Strong Family-Community Ties %',
-    'Trust %'
-]
-
-# Remove dollar signs
-money_columns = [
-    'School Income Estimate'
-]
-
-# Convert ratings to numeric
-rating_columns = [
-    'Rigorous Instruction Rating',
-    'Collaborative Teachers Rating',
-    'Supportive Environment Rating',
-    'Effective School Leadership Rating',
-    'Strong Family-Community Ties Rating',
-    'Trust Rating',
-    'Student Achievement Rating'
-]
-
-# Convert Yes/No to to 1/0
-binary_columns= [
-    'Community School?'
-]
-
-for col in percent_columns:
-    se_2016_renamed[col] = util.pct_to_number(se_2016_renamed, col)
-for col in money_columns:
-    se_2016_renamed[col] = util.money_to_number(se_2016_renamed, col)
-for col in rating_columns:
-    se_2016_renamed[col] = util.rating_to_number(se_2016_renamed, col)
-for col in binary_columns:
-    se_2016_renamed[col] = util.to_binary(se_2016_renamed, col)
-
+# Percent, money, rating and Yes/No columns were already converted to numbers
+# when the schema loader read the raw file; see schema.EXPLORER_SCHEMA.
 se_2016_renamed.columns = [util.sanitize_column_names(c) for c in se_2016_renamed.columns]
 se_2016_renamed.head()
 
@@ -17,6 +17,10 @@
 import pandas as pd
 import datetime
 import re
+from collections import OrderedDict
+import dbncode
+import merging
+import snapshots
 
 # set default options
 pd.set_option('display.max_columns', None)
@@ -25,17 +29,19 @@ pd.set_option('display.max_columns', None)
 # In[44]:
 
 
-# Load all datasets from CSV; when loading set index to the DBN column (to enforce uniqueness)
-shsat_df = pd.read_csv('data_cleaned/cleaned_shsat_outcomes.csv', index_col="dbn")
+# Load all datasets from CSV; when loading set index to the DBN column (to enforce uniqueness).
+# The index holds the DBNs as compact integer codes (see dbncode.py), so the joins below
+# compare integers rather than strings.
+shsat_df = dbncode.read_csv('data_cleaned/cleaned_shsat_outcomes.csv')
 print('SHSAT dataset:',shsat_df.shape) # confirm that it's (589, 5)
 
-class_sizes_df = pd.read_csv('data_cleaned/cleaned_class_sizes.csv', index_col="dbn")
+class_sizes_df = dbncode.read_csv('data_cleaned/cleaned_class_sizes.csv')
 print('Class size dataset:', class_sizes_df.shape) # confirm that it's (494, 13)
 
-explorer_df = pd.read_csv('data_cleaned/cleaned_explorer.csv', index_col="dbn")
+explorer_df = dbncode.read_csv('data_cleaned/cleaned_explorer.csv')
 print('Explorer dataset:', explorer_df.shape) # confirm that it's (596, 55)
 
-selectiveness_df = pd.read_csv('data_cleaned/selectiveness.csv', index_col='dbn')
+selectiveness_df = dbncode.read_csv('data_cleaned/selectiveness.csv')
 print('Selectiveness dataset:', selectiveness_df.shape) # confirm that it's (589, 2)
 
 
@@ -61,9 +67,17 @@ print("{0}.".format(bool(sum(shsat_dups) + sum(class_sizes_dups) + sum(explorer_
 # In[32]:
 
 
-merged_df = shsat_df.join(explorer_df, how="inner")
-merged_df = merged_df.join(class_sizes_df, how="inner")
-merged_df = merged_df.join(selectiveness_df, how="inner")
+# Every source is aligned on the DBN index once, and both the full dataset and the variant
+# without class sizes (saved below) are cut from that alignment, along with their null profiles.
+sources = OrderedDict([('shsat', shsat_df),
+                       ('explorer', explorer_df),
+                       ('class_sizes', class_sizes_df),
+                       ('selectiveness', selectiveness_df)])
+variants = OrderedDict([('all', ['shsat', 'explorer', 'class_sizes', 'selectiveness']),
+                        ('no_class_sizes', ['shsat', 'explorer', 'selectiveness'])])
+merged = merging.merge_variants(sources, variants)
+
+merged_df, merged_profile = merged['all']
 print("Merged Dataframe shape:",merged_df.shape)
 
 
@@ -85,8 +99,8 @@ print("Merged DF shape:",merged_df.shape)
 # In[35]:
 
 
-print("Total empty cells:",merged_df.isnull().sum().sum())
-print("Percent null: {0:.3f}%".format(100*merged_df.isnull().sum().sum()/(merged_df.shape[0]*merged_df.shape[1])))
+print("Total empty cells:",merged_profile.total_nulls)
+print("Percent null: {0:.3f}%".format(merged_profile.pct_null))
 
 
 # Let's take a look at our worst offending rows and columns to see if anything stands out enough to be removed:
@@ -96,7 +110,7 @@ print("Percent null: {0:.3f}%".format(100*merged_df.isnull().sum().sum()/(merged
 # In[36]:
 
 
-merged_df.isnull().sum()[merged_df.isnull().sum() > 0]    .sort_values(ascending=False)
+merged_profile.column_nulls
 
 
 # ### Rows with Nulls
@@ -104,22 +118,23 @@ merged_df.isnull().sum()[merged_df.isnull().sum() > 0]    .sort_values(ascending
 # In[37]:
 
 
-merged_df.isnull().sum(axis=1)[merged_df.isnull().sum(axis=1) > 0]    .sort_values(ascending=False)
+# rows are labeled with their DBN strings
+merged_profile.row_nulls.rename(index=lambda code: dbncode.decode([code])[0])
 
 
 # At the moment we don't see any of these as being offending enough to be removed, especially since we have already preserved some info from the 'school_income_estimate' feature.
 
-# ## Save a dated file
+# ## Save a dated snapshot
 # 
-# To allow updates to the merged dataframe without disrupting work on models downstream until they are ready, we save a dated merged filename.
+# To allow updates to the merged dataframe without disrupting work on models downstream until they are ready, we save it as a snapshot tagged with the date (and 'latest') in the snapshot store under data_merged/snapshots.  Only the parts of the data that changed since earlier snapshots take up new space; models load the latest one by default, or another tag with `util.read_data(snapshot=...)`.
 
 # In[38]:
 
 
-# Get the date to create the filename.
+# Get the date to tag the snapshot with.
 d = datetime.date
-filename = "combined_data_{0}.csv".format( d.today().isoformat() )
-print(filename)
+tag = d.today().isoformat()
+print(tag)
 
 
 # In[39]:
@@ -132,7 +147,9 @@ merged_df.shape
 # In[40]:
 
 
-merged_df.to_csv("data_merged/{0}".format(filename))
+# snapshots hold a dbn string column, like the CSVs we used to write
+store = snapshots.SnapshotStore()
+store.save(dbncode.with_dbn_index(merged_df).reset_index(), 'combined_data', tags=[tag])
 
 
 # ## Save alternate dataset without class size information
@@ -141,8 +158,7 @@ merged_df.to_csv("data_merged/{0}".format(filename))
 # In[41]:
 
 
-no_class_size_df = shsat_df.join(explorer_df, how="inner")
-no_class_size_df = no_class_size_df.join(selectiveness_df, how="inner")
+no_class_size_df, no_class_size_profile = merged['no_class_sizes']
 print("Merged Dataframe shape (without class size data):",no_class_size_df.shape)
 
 
@@ -151,12 +167,11 @@ print("Merged Dataframe shape (without class size data):",no_class_size_df.shape
 # In[42]:
 
 
-print("Total empty cells:",no_class_size_df.isnull().sum().sum())
-print("Percent null: {0:.3f}%".format(100*no_class_size_df.isnull().sum().sum()/
-                                      (no_class_size_df.shape[0]*no_class_size_df.shape[1])))
+print("Total empty cells:",no_class_size_profile.total_nulls)
+print("Percent null: {0:.3f}%".format(no_class_size_profile.pct_null))
 
 # check columns with nulls
-no_class_size_df.isnull().sum()[no_class_size_df.isnull().sum() > 0]    .sort_values(ascending=False)
+no_class_size_profile.column_nulls
 
 
 # There characteristics are similar to our primary dataset, so we should feel comfortable using it if we do not need the class size data in our models.  Note that several of the columns with nulls in our primary merged dataset originally came from the class size data.  As a result, aside from `school_income_estimate`, our columns look quite good with respect to nulls.
@@ -164,12 +179,8 @@ no_class_size_df.isnull().sum()[no_class_size_df.isnull().sum() > 0]    .sort_va
 # In[43]:
 
 
-# Get the date to create the filename.
-filename = "combined_data_no_class_sizes_{0}.csv".format( d.today().isoformat() )
-print(filename)
-
 # check final shape (556, 62)
 print(no_class_size_df.shape)
 
-no_class_size_df.to_csv("data_merged/{0}".format(filename))
+store.save(dbncode.with_dbn_index(no_class_size_df).reset_index(), 'combined_data_no_class_sizes', tags=[tag])
 
@@ -0,0 +1,131 @@
+# Incremental runner for the prep_* notebooks
+#
+# Each prep stage is declared with the files it reads and writes.  We remember
+# the content hash of every input as of the stage's last successful run, and
+# only re-run stages whose notebook or inputs have changed since (or whose
+# outputs are missing).  Because downstream stages list upstream outputs as
+# inputs, a change to one raw file re-runs exactly the stages that depend on
+# it -- and nothing further if an upstream stage reproduces identical output.
+# Stages that don't depend on each other run concurrently in a process pool.
+#
+# Usage: python prep_pipeline.py [--dry-run] [--force] [--jobs N]
+
+import argparse
+import fnmatch
+import glob
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from datacache import file_hash
+
+STATE_FILE = 'cache_prep/state.json'
+
+Stage = namedtuple('Stage', ['name', 'notebook', 'inputs', 'outputs'])
+
+# outputs may be glob patterns
+STAGES = [
+    Stage('explorer', 'prep_explorer.ipynb',
+          inputs=['data_raw/2016_school_explorer.csv', 'util.py', 'schema.py', 'geography.py'],
+          outputs=['data_cleaned/cleaned_explorer.csv']),
+    Stage('class_sizes', 'prep_class_sizes.ipynb',
+          inputs=['data_raw/February2017_Avg_ClassSize_School_all.csv', 'util.py'],
+          outputs=['data_cleaned/cleaned_class_sizes.csv']),
+    Stage('shsat_results', 'prep_shsat_results.ipynb',
+          inputs=['data_raw/nytdf.csv', 'data_raw/doe_demographic_snapshot_school.csv',
+                  'data_raw/2016_school_explorer.csv', 'util.py'],
+          outputs=['data_cleaned/cleaned_shsat_outcomes.csv']),
+    Stage('merge', 'prep_merge.ipynb',
+          inputs=['data_cleaned/cleaned_shsat_outcomes.csv', 'data_cleaned/cleaned_class_sizes.csv',
+                  'data_cleaned/cleaned_explorer.csv', 'data_cleaned/selectiveness.csv', 'dbncode.py', 'merging.py',
+                  'snapshots.py'],
+          outputs=['data_merged/snapshots/manifest.json']),
+]
+
+
+def upstream(stage, stages=STAGES):
+    """Stages whose outputs `stage` reads"""
+    return [s for s in stages if s is not stage and
+            any(fnmatch.fnmatch(i, o) for i in stage.inputs for o in s.outputs)]
+
+def levels(stages=STAGES):
+    """Group stages into levels; every stage only depends on earlier levels"""
+    remaining = list(stages)
+    done = []
+    grouped = []
+    while remaining:
+        level = [s for s in remaining if all(u in done for u in upstream(s, stages))]
+        if not level:
+            raise ValueError('prep stages have a dependency cycle')
+        grouped.append(level)
+        done.extend(level)
+        remaining = [s for s in remaining if s not in level]
+    return grouped
+
+def fingerprint(stage):
+    """Content hashes of a stage's notebook and inputs"""
+    return {path: file_hash(path) for path in [stage.notebook] + stage.inputs}
+
+def outputs_exist(stage):
+    return all(glob.glob(pattern) for pattern in stage.outputs)
+
+def is_stale(stage, state):
+    return state.get(stage.name) != fingerprint(stage) or not outputs_exist(stage)
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+def run_notebook(notebook, timeout=1200):
+    """Execute a notebook from the repo root without saving its outputs"""
+    import nbformat
+    from nbconvert.preprocessors import ExecutePreprocessor
+
+    with open(notebook, encoding='utf-8') as f:
+        nb = nbformat.read(f, as_version=4)
+    ExecutePreprocessor(timeout=timeout).preprocess(nb, {'metadata': {'path': os.getcwd()}})
+    return notebook
+
+def run(force=False, dry_run=False, jobs=None):
+    '''
+        Bring the prep outputs up to date, returning the names of the stages run.
+        Each level is fingerprinted after the previous one finishes, so a stage
+        only runs if its upstream stages actually changed its inputs.
+    '''
+    state = load_state()
+    ran = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for level in levels():
+            stale = [s for s in level if force or is_stale(s, state)]
+            for stage in level:
+                print('%-14s %s' % (stage.name, 'rebuild' if stage in stale else 'up to date'))
+            if dry_run or not stale:
+                continue
+
+            # fingerprint before running, so edits made while a stage runs aren't missed
+            fingerprints = {s.name: fingerprint(s) for s in stale}
+            futures = {s.name: pool.submit(run_notebook, s.notebook) for s in stale}
+            for name, future in futures.items():
+                future.result()
+                state[name] = fingerprints[name]
+                save_state(state)
+                ran.append(name)
+    return ran
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-run the prep notebooks whose inputs changed.')
+    parser.add_argument('--dry-run', action='store_true', help='only report which stages are stale')
+    parser.add_argument('--force', action='store_true', help='re-run every stage')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+    run(force=args.force, dry_run=args.dry_run, jobs=args.jobs)
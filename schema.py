@@ -0,0 +1,112 @@
+# Column schemas for the raw datasets
+#
+# Each raw column we use is declared once here with the kind of cleanup it
+# needs and the compact dtype it should end up as.  The loader reads only the
+# declared columns, and hands the plain numeric ones straight to read_csv with
+# compact dtypes, so nothing passes through a wide object/float64 frame.
+
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pandas as pd
+import util
+
+# kind: one of 'text', 'category', 'number', 'percent', 'money', 'rating', 'binary'
+Column = namedtuple('Column', ['kind', 'dtype'])
+
+# kinds that need util's string cleanup before they can take their dtype
+CONVERTED_KINDS = ('percent', 'money', 'rating', 'binary')
+
+EXPLORER_SCHEMA = OrderedDict([
+    ('Location Code', Column('text', object)),
+    ('School Name', Column('text', object)),
+    ('District', Column('category', 'category')),
+    ('Zip', Column('category', 'category')),
+    ('Community School?', Column('binary', np.int8)),
+    ('Economic Need Index', Column('number', np.float32)),
+    ('School Income Estimate', Column('money', np.float32)),
+    ('Percent ELL', Column('percent', np.int8)),
+    ('Percent Asian', Column('percent', np.int8)),
+    ('Percent Black', Column('percent', np.int8)),
+    ('Percent Hispanic', Column('percent', np.int8)),
+    ('Percent Black / Hispanic', Column('percent', np.int8)),
+    ('Percent White', Column('percent', np.int8)),
+    ('Student Attendance Rate', Column('percent', np.int8)),
+    ('Percent of Students Chronically Absent', Column('percent', np.int8)),
+    ('Rigorous Instruction %', Column('percent', np.int8)),
+    ('Rigorous Instruction Rating', Column('rating', np.int8)),
+    ('Collaborative Teachers %', Column('percent', np.int8)),
+    ('Collaborative Teachers Rating', Column('rating', np.int8)),
+    ('Supportive Environment %', Column('percent', np.int8)),
+    ('Supportive Environment Rating', Column('rating', np.int8)),
+    ('Effective School Leadership %', Column('percent', np.int8)),
+    ('Effective School Leadership Rating', Column('rating', np.int8)),
+    ('Strong Family-Community Ties %', Column('percent', np.int8)),
+    ('Strong Family-Community Ties Rating', Column('rating', np.int8)),
+    ('Trust %', Column('percent', np.int8)),
+    ('Trust Rating', Column('rating', np.int8)),
+    ('Student Achievement Rating', Column('rating', np.int8)),
+    ('Average ELA Proficiency', Column('number', np.float32)),
+    ('Average Math Proficiency', Column('number', np.float32)),
+    ('Grade 7 ELA - All Students Tested', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - All Students', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - American Indian or Alaska Native', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Black or African American', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Hispanic or Latino', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Asian or Pacific Islander', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - White', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Multiracial', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Limited English Proficient', Column('number', np.int32)),
+    ('Grade 7 ELA 4s - Economically Disadvantaged', Column('number', np.int32)),
+    ('Grade 7 Math - All Students Tested', Column('number', np.int32)),
+    ('Grade 7 Math 4s - All Students', Column('number', np.int32)),
+    ('Grade 7 Math 4s - American Indian or Alaska Native', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Black or African American', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Hispanic or Latino', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Asian or Pacific Islander', Column('number', np.int32)),
+    ('Grade 7 Math 4s - White', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Multiracial', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Limited English Proficient', Column('number', np.int32)),
+    ('Grade 7 Math 4s - Economically Disadvantaged', Column('number', np.int32)),
+])
+
+
+def columns_of_kind(schema, kind):
+    """List the columns of a schema with the given kind, in schema order"""
+    return [col for col, spec in schema.items() if spec.kind == kind]
+
+def _final_dtype(values, dtype):
+    # integer dtypes can't hold NaN, so columns with missing values fall back to float32
+    if np.issubdtype(np.dtype(dtype), np.integer) and np.isnan(values).any():
+        return np.float32
+    return dtype
+
+def read_with_schema(data_file, schema, extra_columns=()):
+    '''
+        Read only the columns declared in `schema` (plus any `extra_columns`,
+        which are read as-is) and return them cleaned up into their declared dtypes.
+    '''
+    read_dtypes = {}
+    for col, spec in schema.items():
+        if spec.kind == 'number':
+            # integer columns may have missing values, so parse them as float32 first
+            is_int = np.issubdtype(np.dtype(spec.dtype), np.integer)
+            read_dtypes[col] = np.float32 if is_int else spec.dtype
+        elif spec.kind != 'category':
+            read_dtypes[col] = object
+
+    df = pd.read_csv(data_file, usecols=list(schema) + list(extra_columns), dtype=read_dtypes)
+    df = util.convert_columns(df,
+                              percent_columns=columns_of_kind(schema, 'percent'),
+                              money_columns=columns_of_kind(schema, 'money'),
+                              rating_columns=columns_of_kind(schema, 'rating'),
+                              binary_columns=columns_of_kind(schema, 'binary'))
+
+    for col, spec in schema.items():
+        if spec.kind == 'category':
+            # categories keep the values' parsed type (e.g. integer zips)
+            df[col] = df[col].astype('category')
+        elif spec.kind != 'text':
+            df[col] = df[col].astype(_final_dtype(df[col].values, spec.dtype))
+
+    # keep the schema's column order, with any extras at the end
+    return df[list(schema) + [c for c in extra_columns if c not in schema]]
@@ -0,0 +1,123 @@
+# Gifted / highly selective flags from cached insideschools pages
+#
+# The flags are icons (spans) inside a page's "school-icons" div.  Rather than
+# building a DOM of the whole page, we jump to each school-icons div and run a
+# small tag tokenizer over just that fragment, collecting the classes of the
+# spans until the div closes.  Pages are independent, so a directory (or a
+# pagestore archive) of them is spread over a process pool.
+
+import csv
+import multiprocessing
+import os
+import re
+from collections import OrderedDict
+import pagestore
+
+PAGE_DIR = 'schoolinfo'
+
+# schools we know to be gifted, though their page has no gifted icon
+GIFTED_OVERRIDES = {'18K235'}    # Janice Marie Knight: SOAR
+
+# opening/closing div and span tags; quoted attribute values may contain '>'
+_TAG = re.compile(r'''<(/?)(div|span)\b((?:[^>"']|"[^"]*"|'[^']*')*)>''', re.IGNORECASE)
+_CLASS = re.compile(r'''(?:^|\s)class\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+
+def _classes(attributes):
+    match = _CLASS.search(attributes)
+    if match is None:
+        return []
+    return next(group for group in match.groups() if group is not None).split()
+
+def icon_classes(html):
+    '''
+        For each school-icons div on the page, the list of class lists of the
+        spans inside it (like BeautifulSoup's div.find_all("span")).
+    '''
+    divs = []
+    position = html.find('school-icons')
+    while position >= 0:
+        start = html.rfind('<', 0, position)
+        opening = _TAG.match(html, start) if start >= 0 else None
+        if (opening is None or opening.group(1) or opening.group(2).lower() != 'div'
+                or 'school-icons' not in _classes(opening.group(3))):
+            position = html.find('school-icons', position + 1)
+            continue
+
+        # tokenize from the opening tag until its div closes
+        spans = []
+        depth = 0
+        end = len(html)
+        for tag in _TAG.finditer(html, start):
+            closing, name = tag.group(1), tag.group(2).lower()
+            if name == 'span':
+                if not closing:
+                    spans.append(_classes(tag.group(3)))
+            elif closing:
+                depth -= 1
+                if depth == 0:
+                    end = tag.end()
+                    break
+            else:
+                depth += 1
+        divs.append(spans)
+        position = html.find('school-icons', end)
+    return divs
+
+def extract_flags(dbn, html):
+    """('gifted', 'selective') flags, as '0'/'1', for each school-icons div on a page"""
+    rows = []
+    for spans in icon_classes(html):
+        gifted = any('icon-gifted' in classes for classes in spans)
+        selective = any('icon-highly-selective' in classes for classes in spans)
+        # as in the original scraper, overrides only apply to divs with icons
+        if spans and dbn in GIFTED_OVERRIDES:
+            gifted = True
+        rows.append((str(int(gifted)), str(int(selective))))
+    return rows
+
+def _extract_file(path):
+    dbn = os.path.basename(path).split('.')[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        return dbn, extract_flags(dbn, f.read())
+
+def extract_categories(paths, n_jobs=-1, chunksize=16):
+    """dbn -> flag rows for each page file in `paths`, in order (n_jobs > 1 or -1 uses a process pool)"""
+    paths = list(paths)
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs == 1 or len(paths) < 2 * chunksize:
+        return OrderedDict(_extract_file(path) for path in paths)
+    with multiprocessing.Pool(n_jobs) as pool:
+        return OrderedDict(pool.imap(_extract_file, paths, chunksize=chunksize))
+
+def _extract_stored(args):
+    store_path, entries = args
+    return [(dbn, extract_flags(dbn, body.decode('utf-8')))
+            for dbn, body in pagestore.read_entries(store_path, entries)]
+
+def extract_store_categories(store, dbns=None, n_jobs=-1, chunksize=16):
+    '''
+        dbn -> flag rows for pages in a PageStore (all of them, or `dbns`), in
+        archive order.  Serially the archive is streamed once; a pool gets
+        runs of `chunksize` pages, each worker reading only its own records
+        (located through the parent's index).
+    '''
+    entries = store.entries(dbns)
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs == 1 or len(entries) < 2 * chunksize:
+        return OrderedDict(_extract_stored((store.path, entries)))
+    chunks = [(store.path, entries[i:i + chunksize]) for i in range(0, len(entries), chunksize)]
+    with multiprocessing.Pool(n_jobs) as pool:
+        return OrderedDict(row for rows in pool.imap(_extract_stored, chunks) for row in rows)
+
+def page_files(page_dir=PAGE_DIR):
+    return [os.path.join(page_dir, name) for name in os.listdir(page_dir) if name.endswith('.html')]
+
+def write_selectiveness(categories, path='data_cleaned/selectiveness.csv'):
+    """Write dbn,gifted,selective rows (one per school-icons div) as a CSV"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['dbn', 'gifted', 'selective'])
+        for dbn, rows in categories.items():
+            for gifted, selective in rows:
+                writer.writerow([dbn, gifted, selective])
@@ -0,0 +1,234 @@
+# PASSNYC prioritization scores for many models at once
+#
+# For each school we estimate how many black/hispanic students it is away from
+# a target registration rate (`minority_delta`), and weight that by how often a
+# model voted the school a high registrant (`score`).  The delta only depends
+# on the school, so for N models we compute it once and broadcast it against a
+# (schools x models) matrix of votes; ranking uses a partial sort when only the
+# top k schools per model are needed.
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# columns of interest for PASSNYC prioritization
+SCORE_FEATURES = ['dbn',
+                  'school_name',
+                  'economic_need_index',
+                  'grade_7_enrollment',
+                  'num_shsat_test_takers',
+                  'pct_test_takers',
+                  'percent_black__hispanic'
+                  ]
+
+# each school is predicted this many times by run_model_get_ordered_predictions
+VOTES_PER_SCHOOL = 10
+
+
+def median_target_pct(train_orig, test_orig, train_labels, test_labels):
+    """Median fraction of test takers among the high registration schools"""
+    X_orig = pd.concat([train_orig, test_orig], sort=True)
+    y = np.concatenate((train_labels, test_labels))
+    return np.median(X_orig[y == 1]['pct_test_takers']) / 100
+
+def minority_deltas(schools, target_pct):
+    '''
+        Number of black/hispanic students each school is away from the
+        target percentage of test takers (negative when above target).
+    '''
+    # Determine the number of test takers this school would have needed to meet the target
+    target_test_takers = schools['grade_7_enrollment'].values * target_pct
+    # Subtract the number of actual test takers from the hypothetical minimum number
+    delta = target_test_takers - schools['num_shsat_test_takers'].values
+    # Multiply the delta by the minority percentage of the school
+    return np.round(delta * schools['percent_black__hispanic'].values / 100, 0).astype(int)
+
+def batch_scores(votes, deltas):
+    """(schools x models) scores: each school's delta, weighted by the fraction of 1 votes"""
+    return deltas[:, np.newaxis] * (np.asarray(votes) / VOTES_PER_SCHOOL)
+
+def rank_order(scores, top_k=None):
+    '''
+        Row indices of the highest scores for each model (column), best first,
+        as a (top_k x models) array.  Ties keep row order, so the top_k rows are
+        always the first top_k of the full ranking; only the rows scoring at
+        least the k-th best score (found with a partition) are sorted.
+    '''
+    n_schools = scores.shape[0]
+    full_order = lambda s: np.argsort(-s, axis=0, kind='mergesort')
+    if top_k is None or top_k >= n_schools:
+        return full_order(scores)
+
+    kth_best = -np.partition(-scores, top_k - 1, axis=0)[top_k - 1]
+    order = np.empty((top_k, scores.shape[1]), dtype=np.intp)
+    for m in range(scores.shape[1]):
+        column = scores[:, m]
+        candidates = np.flatnonzero(column >= kth_best[m])
+        if len(candidates) < top_k:
+            # NaN scores (which sort last) are needed to fill the list
+            order[:, m] = full_order(column)[:top_k]
+            continue
+        # by score, then by row, as the stable full sort orders them
+        order[:, m] = candidates[np.lexsort((candidates, -column[candidates]))][:top_k]
+    return order
+
+def create_passnyc_lists(votes, schools, target_pct, top_k=None):
+    '''
+        inputs: votes (dataframe of '1s' counts, one column per model, indexed like `schools`),
+                schools (dataframe with SCORE_FEATURES), target_pct (see median_target_pct)
+        returns: ordered dict of model name -> ranked dataframe, with the same columns
+                 as util.create_passnyc_list (only the top_k rows if top_k is given)
+    '''
+    schools = schools.loc[votes.index, SCORE_FEATURES]
+    deltas = minority_deltas(schools, target_pct)
+    scores = batch_scores(votes.values, deltas)
+    order = rank_order(scores, top_k)
+
+    lists = OrderedDict()
+    for m, model in enumerate(votes.columns):
+        rows = order[:, m]
+        df_passnyc = schools.iloc[rows].copy()
+        df_passnyc.insert(0, '1s', votes.values[rows, m])
+        df_passnyc['minority_delta'] = deltas[rows]
+        df_passnyc['score'] = scores[rows, m]
+        df_passnyc.insert(0, 'rank', range(1, len(rows) + 1))
+        lists[model] = df_passnyc
+    return lists
+
+def ensemble_scores(votes, schools, target_pct):
+    '''
+        One row per school with each model's score and their average ('avg'),
+        ranked by the average, as in the overview notebook.
+    '''
+    schools = schools.loc[votes.index]
+    scores = pd.DataFrame(batch_scores(votes.values, minority_deltas(schools, target_pct)),
+                          index=votes.index, columns=votes.columns)
+    scores['avg'] = scores.mean(axis=1)
+    df_final = pd.concat([schools[['dbn', 'school_name']], scores], axis=1)
+    df_final = df_final.iloc[np.argsort(-scores['avg'].values, kind='mergesort')]
+    df_final.insert(0, 'rank', range(1, df_final.shape[0] + 1))
+    return df_final
+
+
+### What-if analysis of the score formula
+
+def _minority_shares(schools, minority_definitions):
+    """(schools x definitions) minority percentages; a definition is a column
+    name or a tuple of columns to add up (e.g. ('percent_black', 'percent_hispanic'))"""
+    shares = []
+    for definition in minority_definitions:
+        cols = [definition] if isinstance(definition, str) else list(definition)
+        shares.append(schools[cols].values.sum(axis=1))
+    return np.column_stack(shares)
+
+def sensitivity_scores(votes, schools, positive_pcts, target_percentiles=(50,),
+                       vote_exponents=(1,), minority_definitions=('percent_black__hispanic',)):
+    '''
+        Scores for every combination of formula parameters, in one broadcast:
+        - target_percentiles: percentile of `positive_pcts` (pct_test_takers of the
+          high registration schools) used as the target; 50 is the median
+        - vote_exponents: votes are weighted as (votes / VOTES_PER_SCHOOL) ** exponent;
+          1 is the current linear weighting
+        - minority_definitions: see _minority_shares
+        returns: scores (schools x parameterizations) and a dataframe describing
+                 each parameterization (one row per column of scores)
+    '''
+    votes = np.asarray(votes, dtype=float)
+    targets = np.percentile(positive_pcts, target_percentiles) / 100
+    exponents = np.asarray(vote_exponents, dtype=float)
+    shares = _minority_shares(schools, minority_definitions)
+
+    # schools x targets
+    delta = (schools['grade_7_enrollment'].values[:, np.newaxis] * targets[np.newaxis, :]
+             - schools['num_shsat_test_takers'].values[:, np.newaxis])
+    # schools x targets x minority definitions
+    minority_delta = np.round(delta[:, :, np.newaxis] * shares[:, np.newaxis, :] / 100, 0)
+    # schools x vote exponents
+    weights = (votes[:, np.newaxis] / VOTES_PER_SCHOOL) ** exponents[np.newaxis, :]
+    # schools x targets x minority definitions x vote exponents
+    scores = minority_delta[:, :, :, np.newaxis] * weights[:, np.newaxis, np.newaxis, :]
+
+    grid = pd.MultiIndex.from_product([list(target_percentiles),
+                                       [str(d) for d in minority_definitions],
+                                       list(vote_exponents)],
+                                      names=['target_percentile', 'minority', 'vote_exponent'])
+    return scores.reshape(len(votes), -1), pd.DataFrame(list(grid), columns=grid.names)
+
+def score_ranks(scores):
+    """Rank (1 = highest score) of each school under each parameterization"""
+    order = np.argsort(-scores, axis=0, kind='mergesort')
+    ranks = np.empty_like(order)
+    ranks[order, np.arange(scores.shape[1])] = np.arange(1, scores.shape[0] + 1)[:, np.newaxis]
+    return ranks
+
+def rank_stability(votes, schools, positive_pcts, top_k=20, **grid):
+    '''
+        How much each school's rank moves across the parameter grid (see
+        sensitivity_scores for the grid arguments): rank under the current
+        formula (if it's in the grid), best/median/worst rank, rank std, and the
+        fraction of parameterizations that put the school in the top_k.
+        Returns the per-school table (sorted by median rank) and the grid.
+    '''
+    scores, params = sensitivity_scores(votes, schools, positive_pcts, **grid)
+    ranks = score_ranks(scores)
+
+    stability = pd.DataFrame({'dbn': schools['dbn'].values,
+                              'school_name': schools['school_name'].values,
+                              'best_rank': ranks.min(axis=1),
+                              'median_rank': np.median(ranks, axis=1),
+                              'worst_rank': ranks.max(axis=1),
+                              'rank_std': ranks.std(axis=1),
+                              'top_k_fraction': (ranks <= top_k).mean(axis=1)},
+                             index=schools.index,
+                             columns=['dbn', 'school_name', 'best_rank', 'median_rank',
+                                      'worst_rank', 'rank_std', 'top_k_fraction'])
+
+    baseline = ((params['target_percentile'] == 50) &
+                (params['minority'] == 'percent_black__hispanic') &
+                (params['vote_exponent'] == 1)).values
+    if baseline.any():
+        stability.insert(2, 'current_rank', ranks[:, np.argmax(baseline)])
+
+    return stability.sort_values(by='median_rank'), params
+
+
+### Rank uncertainty from the individual fold votes
+
+def repeat_votes(fold_votes, n_splits=5):
+    '''
+        Collapse a (schools x n_repeats*n_splits) fold vote matrix (-1 where the
+        school was in training) into (schools x n_repeats) votes: every repeat
+        predicts each school exactly once.
+    '''
+    fold_votes = np.asarray(fold_votes)
+    n_repeats = fold_votes.shape[1] // n_splits
+    return fold_votes.reshape(fold_votes.shape[0], n_repeats, n_splits).max(axis=2)
+
+def rank_uncertainty(fold_votes, schools, target_pct, n_resamples=2000, top_k=20,
+                     interval=95, n_splits=5, random_state=207):
+    '''
+        Bootstrap the repeats of the repeated k-fold vote matrix to see how much
+        each school's rank depends on which repeats we happened to run.  All
+        resamples are drawn at once as a (resamples x repeats) matrix of counts,
+        so the resampled '1s' counts come out of a single matrix product.
+        returns: per-school rank interval (rank_low, rank_high), median rank and
+                 the probability of being in the top_k, indexed like `schools`
+    '''
+    votes = repeat_votes(fold_votes, n_splits).astype(np.float32)
+    n_schools, n_repeats = votes.shape
+    rng = np.random.RandomState(random_state)
+
+    # how many times each repeat is picked in each resample
+    counts = rng.multinomial(n_repeats, np.ones(n_repeats) / n_repeats, size=n_resamples)
+    ones = votes.dot(counts.T.astype(np.float32)) * (VOTES_PER_SCHOOL / float(n_repeats))
+
+    scores = minority_deltas(schools, target_pct)[:, np.newaxis] * (ones / VOTES_PER_SCHOOL)
+    ranks = score_ranks(scores)
+
+    tail = (100 - interval) / 2.0
+    return pd.DataFrame({'rank_low': np.percentile(ranks, tail, axis=1),
+                         'rank_median': np.median(ranks, axis=1),
+                         'rank_high': np.percentile(ranks, 100 - tail, axis=1),
+                         'top_k_prob': (ranks <= top_k).mean(axis=1)},
+                        index=schools.index,
+                        columns=['rank_low', 'rank_median', 'rank_high', 'top_k_prob'])
@@ -0,0 +1,94 @@
+# Local stand-in for insideschools.org, for exercising sel_scrape offline
+#
+# Serves /school/<dbn> from the cached schoolinfo/<dbn>.html pages over
+# HTTP/1.1 (keep-alive), optionally failing a fraction of requests with a 503
+# so the scraper's retries get exercised.  Pages carry an ETag (hash of the
+# file) and Last-Modified (its mtime), and conditional requests get a 304.
+#
+#     python scrape_standin.py 8000
+#     >>> sel_scrape.download_pages(base_url='http://127.0.0.1:8000/school/', page_dir='/tmp/pages')
+
+import hashlib
+import os
+import random
+import sys
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(page_dir='schoolinfo', failure_rate=0.0, random_state=207):
+    rng = random.Random(random_state)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        counts = {'requests': 0, 'failures': 0, 'not_modified': 0}
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b'', headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                self.counts['requests'] += 1
+                fail = rng.random() < failure_rate
+                if fail:
+                    self.counts['failures'] += 1
+            if fail:
+                return self._send(503)
+
+            dbn = self.path.rstrip('/').rsplit('/', 1)[-1]
+            path = os.path.join(page_dir, '%s.html' % dbn)
+            if not self.path.startswith('/school/') or not os.path.exists(path):
+                return self._send(404)
+            with open(path, 'rb') as f:
+                body = f.read()
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            mtime = int(os.path.getmtime(path))
+            validators = [('ETag', etag), ('Last-Modified', formatdate(mtime, usegmt=True))]
+
+            # If-None-Match takes precedence over If-Modified-Since
+            if 'If-None-Match' in self.headers:
+                not_modified = etag in self.headers['If-None-Match']
+            elif 'If-Modified-Since' in self.headers:
+                since = parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp()
+                not_modified = mtime <= since
+            else:
+                not_modified = False
+            if not_modified:
+                with lock:
+                    self.counts['not_modified'] += 1
+                return self._send(304, headers=validators)
+            self._send(200, body, [('Content-Type', 'text/html; charset=utf-8')] + validators)
+
+    return Handler
+
+def start(port=0, page_dir='schoolinfo', failure_rate=0.0):
+    '''
+        Serve in a background thread; returns the server (stop it with
+        shutdown()).  With port=0 a free port is picked, see server_address.
+    '''
+    server = _ThreadingServer(('127.0.0.1', port), make_handler(page_dir, failure_rate))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = _ThreadingServer(('127.0.0.1', port), make_handler())
+    print('serving schoolinfo/ on http://127.0.0.1:%d/school/<dbn>' % port)
+    server.serve_forever()
@@ -3,16 +3,22 @@
 # For each school, we check if:
 # - it is a gifted school
 # - it is a highly selective school
-# We print out a CSV with the following columns:
+# We write data_cleaned/selectiveness.csv with the following columns:
 # dbn,gifted,selective
 # gifted can be: (0, 1)
 # selective can be: (0, 1)
 
-import urllib
-from bs4 import BeautifulSoup
 import csv
-import time
+import hashlib
+import json
 import os
+from collections import OrderedDict
+import asyncfetch
+import schoolicons
+
+BASE_URL = 'https://insideschools.org/school/'
+PAGE_DIR = 'schoolinfo'
+INDEX_FILE = 'index.json'
 
 def get_dbns():
     dbns = []
@@ -22,50 +28,171 @@ def get_dbns():
             dbns.append(row['dbn'])
     return dbns
 
-def get_school_info(dbn):
-    info_page = 'https://insideschools.org/school/%s' % dbn
-    print('requesting: %s' % info_page)
-    page = urllib.request.urlopen(info_page)
-    soup = BeautifulSoup(page, 'html.parser')
-    with open("schoolinfo/%s.html" % dbn, "w") as file:
-        file.write(str(soup))
-
-def download_pages():
-    dbns = get_dbns()
-    for dbn in dbns:
-        if os.path.exists('schoolinfo/%s.html' % dbn):
-            print('skipping for: %s' % dbn)
-            continue 
-        print(dbn)
-        get_school_info(dbn)
-        time.sleep(3)
-
-def print_school_category(override_list=None):
-    schools = os.listdir(path='schoolinfo')
+def save_page(page_dir, dbn, body, store=None):
+    if store is not None:
+        # the store's index is written once the download finishes
+        store.put(dbn, body, sync=False)
+        print('saved: %s' % dbn)
+        return
+    path = os.path.join(page_dir, '%s.html' % dbn)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(body)
+    os.replace(path + '.tmp', path)
+    print('saved: %s' % dbn)
+
+# Per-DBN page index: the validators the server sent with the page (ETag,
+# Last-Modified), the SHA-1 of the saved page, and the flags parsed from it.
+def load_page_index(page_dir=PAGE_DIR):
+    try:
+        with open(os.path.join(page_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_page_index(index, page_dir=PAGE_DIR):
+    os.makedirs(page_dir, exist_ok=True)
+    path = os.path.join(page_dir, INDEX_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def page_hash(body):
+    return hashlib.sha1(body).hexdigest()
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def download_pages(base_url=BASE_URL, page_dir=PAGE_DIR, concurrency=4, rate=1.0, retries=3,
+                   revalidate=False, store=None):
+    # Pages are fetched concurrently (at most `concurrency` at a time, starting
+    # no more than `rate` per second) and saved as they arrive.  Point base_url
+    # at scrape_standin.py to try it out without hitting insideschools.org.
+    # Pages we already have are skipped, unless revalidate=True: then they are
+    # requested conditionally, and only rewritten if the server sends a page
+    # whose contents changed.  Returns the DBNs whose page was (re)written.
+    # With a pagestore.PageStore as `store`, pages go into its archive rather
+    # than one file each (page_dir still holds the page index).
+    os.makedirs(page_dir, exist_ok=True)
+    index = load_page_index(page_dir)
+    urls = {}
+    have = set()
+    for dbn in get_dbns():
+        if _have_page(page_dir, dbn, store):
+            have.add(dbn)
+            if not revalidate:
+                print('skipping for: %s' % dbn)
+                continue
+        urls[dbn] = base_url + dbn
+
+    changed = []
+    def on_response(dbn, response):
+        if response.status == 304:
+            return
+        entry = index.setdefault(dbn, {})
+        digest = page_hash(response.body)
+        if dbn not in have or digest != _saved_hash(page_dir, dbn, entry, store):
+            save_page(page_dir, dbn, response.body, store)
+            changed.append(dbn)
+        entry.update({'etag': response.headers.get('etag'),
+                      'last_modified': response.headers.get('last-modified'),
+                      'sha1': digest})
+
+    def headers(dbn):
+        return conditional_headers(index.get(dbn, {})) if dbn in have else {}
+
+    try:
+        failures = asyncfetch.run(asyncfetch.fetch_all(urls, on_response, concurrency=concurrency,
+                                                       rate=rate, retries=retries, headers=headers))
+    finally:
+        if store is not None:
+            store.flush()
+        save_page_index(index, page_dir)
+    for dbn, error in sorted(failures.items()):
+        print('failed: %s (%s)' % (dbn, error))
+    if revalidate:
+        print('%d of %d pages changed' % (len(changed), len(urls)))
+    return changed
+
+def _have_page(page_dir, dbn, store=None):
+    if store is not None:
+        return dbn in store
+    return os.path.exists(os.path.join(page_dir, '%s.html' % dbn))
+
+def _saved_hash(page_dir, dbn, entry, store=None):
+    """SHA-1 of the page on disk (from the index, if we wrote it)"""
+    if store is not None:
+        entry['sha1'] = store.sha1(dbn)
+    elif 'sha1' not in entry:
+        with open(os.path.join(page_dir, '%s.html' % dbn), 'rb') as f:
+            entry['sha1'] = page_hash(f.read())
+    return entry['sha1']
+
+def parse_school_page(dbn, html):
+    """(gifted, selective) flags for each school-icons div on a page"""
+    return schoolicons.extract_flags(dbn, html)
+
+def school_categories(schools, page_dir=PAGE_DIR, n_jobs=-1, store=None):
+    '''
+        dbn -> list of (gifted, selective) for each page file in `schools`
+        (or each DBN, when the pages are in a PageStore).  Flags are kept in
+        the page index along with the hash of the page they came from, so a
+        page is only re-parsed after its contents change; pages that do need
+        parsing are spread over a process pool.
+    '''
+    index = load_page_index(page_dir)
+    stale = []
+    for school in schools:
+        dbn = school.split('.')[0]
+        entry = index.setdefault(dbn, {})
+        if store is not None:
+            # the store knows the hash of each page it holds
+            digest = store.sha1(dbn)
+        else:
+            with open(os.path.join(page_dir, school), 'rb') as f:
+                # hashing is much cheaper than parsing
+                digest = page_hash(f.read())
+        entry['sha1'] = digest
+        if entry.get('parsed_sha1') != digest:
+            stale.append(dbn if store is not None else os.path.join(page_dir, school))
+
+    if store is not None:
+        parsed = schoolicons.extract_store_categories(store, stale, n_jobs) if stale else {}
+    else:
+        parsed = schoolicons.extract_categories(stale, n_jobs)
+    for dbn, rows in parsed.items():
+        index[dbn].update({'parsed_sha1': index[dbn]['sha1'], 'flags': rows})
+    save_page_index(index, page_dir)
+
+    categories = OrderedDict()
+    for school in schools:
+        dbn = school.split('.')[0]
+        categories[dbn] = [tuple(row) for row in index[dbn]['flags']]
+    return categories
+
+def _schools(page_dir, store=None):
+    """Page files (or stored DBNs) sorted by DBN, so output doesn't depend on listing order"""
+    if store is not None:
+        return sorted(store.keys())
+    return sorted(f for f in os.listdir(path=page_dir) if f.endswith('.html'))
+
+def print_school_category(override_list=None, page_dir=PAGE_DIR, store=None):
+    schools = _schools(page_dir, store)
     if override_list is not None:
         schools = override_list
     print('dbn,gifted,selective')
-    for school in schools:
-        dbn = school.split('.')[0]
-        school_path = 'schoolinfo/' + school
-        school_fd = open(school_path, "r", encoding='utf-8')
-        soup = BeautifulSoup(school_fd, "html.parser")
-        divs = soup \
-            .find_all("div", {"class": "school-icons"})
-        for div in divs:
-            spans = div.find_all("span")
-            gifted = '0'
-            selective = '0'
-            for span in spans:
-                #print(span)
-                if "icon-gifted" in span['class']:
-                    gifted = '1'
-                if "icon-highly-selective" in span['class']:
-                    selective = '1'
-                if dbn == '18K235':    # Janice Marie Knight: SOAR
-                    gifted = '1'
+    for dbn, rows in school_categories(schools, page_dir, store=store).items():
+        for gifted, selective in rows:
             print("%s,%s,%s" % (dbn, gifted, selective))
 
+def write_school_category(path='data_cleaned/selectiveness.csv', page_dir=PAGE_DIR, store=None):
+    schools = _schools(page_dir, store)
+    schoolicons.write_selectiveness(school_categories(schools, page_dir, store=store), path)
+
 if __name__ == '__main__':
     download_pages()
-    print_school_category()
+    write_school_category()
@@ -0,0 +1,200 @@
+# Content-addressed store for versions of the merged dataset
+#
+# Rather than a full dated CSV per prep_merge run, each snapshot is split into
+# runs of rows, and each column's part of a run is saved as a .npy chunk named
+# by the hash of its contents.  Runs end after rows whose key (the index, e.g.
+# the DBN code) hashes to a multiple of BLOCK_ROWS, so boundaries move with the
+# rows rather than sitting at fixed positions: inserting or dropping a school,
+# or changing a value, only touches the chunks of the run around it.  A chunk
+# that didn't change since an earlier snapshot is just referenced again, so a
+# new snapshot only costs the chunks that actually changed.  manifest.json maps each snapshot id to its
+# chunk lists, and each dataset's tags ('latest', a date, ...) to snapshot ids.
+# Columns are only read when asked for.
+#
+#     store = SnapshotStore()
+#     store.save(merged_df, 'combined_data', tags=['2018-07-30'])
+#     df = store.load('combined_data', 'latest')
+
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+from datacache import column_array
+
+STORE_DIR = 'data_merged/snapshots'
+BLOCK_ROWS = 256        # average rows per chunk
+MAX_BLOCK_ROWS = 1024   # runs longer than this are cut anyway
+
+
+def _chunk_hash(values, kind):
+    sha = hashlib.sha1(('%s %s %s' % (kind, values.dtype.str, values.shape)).encode('utf-8'))
+    if kind == 'object':
+        sha.update(pickle.dumps(values.tolist(), protocol=2))
+    else:
+        sha.update(np.ascontiguousarray(values).tobytes())
+    return sha.hexdigest()
+
+
+def row_boundaries(df, block_rows=BLOCK_ROWS, max_rows=MAX_BLOCK_ROWS):
+    '''
+        End positions of the row runs `df` is chunked into.  Without a real
+        index (a RangeIndex just numbers the rows), rows are keyed by their
+        contents instead.
+    '''
+    if isinstance(df.index, pd.RangeIndex):
+        keys = pd.util.hash_pandas_object(df, index=False).values
+    else:
+        keys = pd.util.hash_pandas_object(df.index.to_series(), index=False).values
+    ends = []
+    start = 0
+    for end in list(np.flatnonzero(keys % np.uint64(block_rows) == 0) + 1) + [len(df)]:
+        ends.extend(range(start + max_rows, end, max_rows))
+        if end > start:
+            ends.append(int(end))
+            start = int(end)
+    return ends or [0]
+
+
+def has_store(store_dir=STORE_DIR):
+    """Whether anything has been saved to the store in `store_dir` yet"""
+    return os.path.exists(os.path.join(store_dir, 'manifest.json'))
+
+
+class Snapshot(object):
+    """Lazy view of one snapshot: columns are loaded on first access"""
+
+    def __init__(self, store, snapshot_id, entry):
+        self.store = store
+        self.snapshot_id = snapshot_id
+        self.n_rows = entry['n_rows']
+        self.columns = [col['name'] for col in entry['columns']]
+        self._entry = entry
+        self._specs = {col['name']: col for col in entry['columns']}
+
+    def column(self, name):
+        return self.store._load_column(self._specs[name])
+
+    def index(self):
+        spec = self._entry['index']
+        if spec['kind'] == 'range':
+            return pd.RangeIndex(spec['start'], spec['stop'], spec['step'], name=spec['name'])
+        return pd.Index(self.store._load_column(spec), name=spec['name'])
+
+    def frame(self, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({name: self.column(name) for name in columns},
+                            index=self.index(), columns=columns)
+
+
+class SnapshotStore(object):
+
+    def __init__(self, store_dir=STORE_DIR, block_rows=BLOCK_ROWS, max_block_rows=MAX_BLOCK_ROWS):
+        self.store_dir = store_dir
+        self.block_rows = block_rows
+        self.max_block_rows = max_block_rows
+        os.makedirs(os.path.join(store_dir, 'chunks'), exist_ok=True)
+
+    def _manifest_path(self):
+        return os.path.join(self.store_dir, 'manifest.json')
+
+    def _chunk_path(self, key):
+        return os.path.join(self.store_dir, 'chunks', key + '.npy')
+
+    def manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'snapshots': {}, 'tags': {}}
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _put_column(self, series, ends):
+        """Store a column's chunks, split at row positions `ends` (skipping
+        chunks already in the store); returns its spec"""
+        values, kind = column_array(series)
+        chunks = []
+        for start, end in zip([0] + ends[:-1], ends):
+            block = values[start:end]
+            key = _chunk_hash(block, kind)
+            path = self._chunk_path(key)
+            if not os.path.exists(path):
+                tmp_path = path + '.tmp.npy'
+                np.save(tmp_path, block, allow_pickle=(kind == 'object'))
+                os.replace(tmp_path, path)
+            chunks.append(key)
+        return {'name': series.name, 'kind': kind, 'chunks': chunks}
+
+    def _load_column(self, spec):
+        blocks = [np.load(self._chunk_path(key), allow_pickle=(spec['kind'] == 'object'))
+                  for key in spec['chunks']]
+        values = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        if spec['kind'] == 'str':
+            values = values.astype(object)
+        return values
+
+    def save(self, df, dataset, tags=()):
+        '''
+            Store `df` as a snapshot of `dataset`, tagged 'latest' plus `tags`.
+            Returns the snapshot id (a hash of its contents), which is the same
+            for identical frames.
+        '''
+        ends = row_boundaries(df, self.block_rows, self.max_block_rows)
+        columns = [self._put_column(df[col].rename(col), ends) for col in df.columns]
+        if isinstance(df.index, pd.RangeIndex):
+            # row numbers would change with every inserted row, so they aren't stored as chunks
+            index = {'name': df.index.name, 'kind': 'range', 'start': df.index.start,
+                     'stop': df.index.stop, 'step': df.index.step, 'chunks': []}
+        else:
+            index = self._put_column(df.index.to_series().rename(df.index.name), ends)
+        entry = {'n_rows': len(df), 'columns': columns, 'index': index}
+        snapshot_id = hashlib.sha1(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
+
+        manifest = self.manifest()
+        manifest['snapshots'][snapshot_id] = entry
+        dataset_tags = manifest['tags'].setdefault(dataset, {})
+        for tag in ['latest'] + list(tags):
+            dataset_tags[tag] = snapshot_id
+        self._write_manifest(manifest)
+        return snapshot_id
+
+    def tags(self, dataset):
+        """Tag -> snapshot id for one dataset"""
+        return dict(self.manifest()['tags'].get(dataset, {}))
+
+    def open(self, dataset, tag='latest'):
+        """Lazy Snapshot of `dataset` by tag (or snapshot id)"""
+        manifest = self.manifest()
+        snapshot_id = manifest['tags'].get(dataset, {}).get(tag, tag)
+        if snapshot_id not in manifest['snapshots']:
+            raise KeyError('no snapshot %r of %s' % (tag, dataset))
+        return Snapshot(self, snapshot_id, manifest['snapshots'][snapshot_id])
+
+    def load(self, dataset, tag='latest', columns=None):
+        return self.open(dataset, tag).frame(columns)
+
+    def prune(self):
+        """Drop snapshots no tag points at, and chunks no snapshot uses"""
+        manifest = self.manifest()
+        tagged = set(sid for tags in manifest['tags'].values() for sid in tags.values())
+        manifest['snapshots'] = {sid: entry for sid, entry in manifest['snapshots'].items()
+                                 if sid in tagged}
+        self._write_manifest(manifest)
+
+        used = set(key for entry in manifest['snapshots'].values()
+                   for spec in entry['columns'] + [entry['index']] for key in spec['chunks'])
+        chunk_dir = os.path.join(self.store_dir, 'chunks')
+        for name in os.listdir(chunk_dir):
+            if name[:-len('.npy')] not in used:
+                os.remove(os.path.join(chunk_dir, name))
+
+    def import_csv(self, data_file, dataset, tags=(), **read_csv_args):
+        """Snapshot an existing CSV (e.g. an old dated combined_data file)"""
+        return self.save(pd.read_csv(data_file, **read_csv_args), dataset, tags)
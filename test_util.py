@@ -0,0 +1,20 @@
+# Tests for util's chunked reader (run with: python -m pytest test_util.py)
+
+import numpy as np
+import pytest
+import util
+
+DATA_FILE = 'data_merged/combined_data_2018-07-30.csv'
+N_ROWS = 464
+
+
+@pytest.mark.parametrize('chunksize', [100, 460, 463, N_ROWS, 1000])
+def test_read_data_chunked_covers_every_row_once(chunksize):
+    # 460 and 463 leave a 4- and a 1-row tail, too small to split on their own
+    parts = list(util.read_data_chunked(DATA_FILE, chunksize=chunksize))
+    index = np.concatenate([np.concatenate([train.index, test.index]) for train, test, _, _ in parts])
+    assert len(index) == N_ROWS
+    assert len(np.unique(index)) == N_ROWS
+    for train, test, train_labels, test_labels in parts:
+        assert len(train) == len(train_labels) and len(test) == len(test_labels)
+        assert len(test) > 0
@@ -1,46 +1,113 @@
 # Utility functions
 
 import matplotlib.pyplot as plt
+import multiprocessing
+import os
+import pickle
 import re
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 from functools import partial
+from scipy import sparse
+from sklearn.base import clone
 from sklearn.decomposition import PCA
+from sklearn.decomposition import TruncatedSVD
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import Imputer
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import RepeatedStratifiedKFold
+from encoding import DummyEncoder
+import datacache
+import dbncode
+import folds
+import metrics
+import scoring
+import snapshots
 
 
 ### Cleanup utility functions
+# These work on whole columns with vectorized pandas ops rather than a Python
+# lambda per cell; convert_columns() handles many columns in a single pass.
+
+RATINGS = {"Exceeding Target": 4,
+           "Meeting Target": 3,
+           "Approaching Target": 2,
+           "Not Meeting Target": 1}
+
+# Raw columns only hold a few hundred distinct strings, so we factorize each
+# column and parse just the distinct values, then broadcast back with take().
+def _convert_uniques(values, convert):
+    codes, uniques = pd.factorize(values)
+    converted = np.append(convert(pd.Series(uniques, dtype=object)), np.nan)
+    # missing values are coded as -1, which picks up the trailing NaN
+    return converted[codes]
+
+def _strip_to_number(values, chars):
+    """Strip `chars` from string values and parse what's left as a number.
+    Missing values (and anything unparseable) come back as NaN."""
+    def convert(uniques):
+        stripped = uniques.astype(str).str.replace(chars, '', regex=True).str.strip()
+        return pd.to_numeric(stripped, errors='coerce').values.astype(float)
+    return _convert_uniques(values, convert)
+
+def _as_type(values, type=int):
+    """Cast to `type` like the original row-wise helpers: integer columns
+    only stay integers when nothing is missing (NaN needs a float)"""
+    if type is int and not np.isnan(values).any():
+        return values.astype(np.int64)
+    return values.astype(float)
+
+def _rating_values(values):
+    """Map rating strings to 1-4; unknown ratings are 0, missing stay NaN"""
+    return _convert_uniques(values, lambda u: u.map(RATINGS).fillna(0).values.astype(float))
+
+def _binary_values(values):
+    return (pd.Series(values, dtype=object) == 'Yes').values.astype(int)
 
 def pct_to_number(df, col, type=int):
     """Pass type=float if you have floating point values"""
-    return df[col].astype(str).apply(lambda s: int(s.strip('%')) if s != 'nan' else np.nan)
+    return pd.Series(_as_type(_strip_to_number(df[col].values, '%'), type), index=df.index, name=col)
 
 def money_to_number(df, col, type=float):
     """Pass type=float if you have floating point values"""
-    return df[col].astype(str).apply(lambda s: type(re.sub('[$,]', '', s)) if s != 'nan' else np.nan)
+    return pd.Series(_as_type(_strip_to_number(df[col].values, '[$,]'), type), index=df.index, name=col)
 
 def translate_ratings(rating):
-    if rating == "Exceeding Target":
-        return 4
-    elif rating == "Meeting Target":
-        return 3
-    elif rating == "Approaching Target":
-        return 2
-    elif rating == "Not Meeting Target":
-        return 1
-    elif s != 'nan':
-        return 0
+    if pd.isnull(rating):
+        return np.nan
+    return RATINGS.get(rating, 0)
 
 def rating_to_number(df, col, type=int):
-    return df[col].astype(str).apply(lambda s: translate_ratings(s) if s != 'nan' else np.nan)
+    return pd.Series(_as_type(_rating_values(df[col].values), type), index=df.index, name=col)
 
 def to_binary(df, col, type=int):
-    return df[col].astype(str).apply(lambda s: 1 if s=='Yes' else 0)
+    return pd.Series(_as_type(_binary_values(df[col].values), type), index=df.index, name=col)
+
+def convert_columns(df, percent_columns=(), money_columns=(),
+                    rating_columns=(), binary_columns=()):
+    """Convert several groups of columns at once, returning a new dataframe.
+    Each group is flattened into one long array and converted in a single
+    vectorized pass, instead of one pass per column.  Columns get the same
+    dtypes as the per-column helpers' defaults."""
+    converted = df.copy()
+    groups = [(percent_columns, lambda v: _strip_to_number(v, '%'), int),
+              (money_columns, lambda v: _strip_to_number(v, '[$,]'), float),
+              (rating_columns, _rating_values, int),
+              (binary_columns, _binary_values, int)]
+    for cols, convert, type in groups:
+        cols = list(cols)
+        if not cols:
+            continue
+        block = df[cols].values
+        values = convert(block.ravel(order='F')).reshape(block.shape, order='F')
+        for i, col in enumerate(cols):
+            converted[col] = _as_type(values[:, i], type)
+    return converted
 
 # Having spaces etc. can cause annoying problems: replace with underscores
 def sanitize_column_names(c):
@@ -64,37 +131,14 @@ def get_dummies(train_data, test_data, factor_cols=['zip','district']):
         inputs: train_data, test_data (pandas dataframes)
         returns: train_data_ohe, test_data_ohe (pandas dataframes)
         NOTE: any factors discovered in test set, which weren't in training, are ignored
+        For reuse on later batches, or sparse output, use encoding.DummyEncoder directly.
     '''
-    
-    for f in factor_cols:
-        train_dummies = pd.get_dummies(train_data[f], prefix=f)
-        tmp_test_dummies = pd.get_dummies(test_data[f], prefix=f)
-
-        # create empty test_dummies dataframe; fill only with columns also in train_dummies
-        # it's important to have the same number of columns in both dataframes
-        test_dummies = pd.DataFrame()
-        
-        train_dummy_cols = train_dummies.columns.values
-        tmp_test_dummy_cols = tmp_test_dummies.columns.values
-        
-        # this loop ensures the same dummy columns in train & test (in the same order)
-        for col in train_dummy_cols:
-            # if a training dummy was also created for test, keep the test dummy
-            if col in tmp_test_dummy_cols:
-                test_dummies[col]=tmp_test_dummies[col]
-            # if training a dummy was not created for test, add it (with all zeros)
-            else:
-                test_dummies[col] = pd.Series([0 for x in range(len(tmp_test_dummies.index))],
-                                              index=tmp_test_dummies.index)
-    
-        # join the new dummies to the original dataset
-        train_data_merged = train_data.join(train_dummies, how="inner")
-        test_data_merged = test_data.join(test_dummies, how="inner")
 
-    # drop original columns after one hot encoding
-    train_data_ohe = train_data_merged.drop(factor_cols, axis=1)
-    test_data_ohe = test_data_merged.drop(factor_cols, axis=1)
-    
+    # learn the dummy columns on the training set only, so test gets the same columns (in the same order)
+    encoder = DummyEncoder(factor_cols=factor_cols)
+    train_data_ohe = encoder.fit_transform(train_data)
+    test_data_ohe = encoder.transform(test_data)
+
     print('Train data initial shape:',train_data.shape)
     print('Test  data initial shape:',test_data.shape)
     print('Train data OHE\'d shape:',train_data_ohe.shape)
@@ -102,31 +146,50 @@ def get_dummies(train_data, test_data, factor_cols=['zip','district']):
 
     return train_data_ohe, test_data_ohe
     
-def get_num_pcas (train_data, var_explained=0.9):
+def explained_variance_curve(train_data, max_components=20, svd_solver='full'):
+    """Cumulative variance explained by the first 1..max_components principal
+    components, from a single decomposition of the standardized data.
+    Use svd_solver='randomized' for wide (e.g. OHE'd) data; sparse input is
+    handled with TruncatedSVD so it never gets densified."""
+    n_components = min(max_components, train_data.shape[0], train_data.shape[1])
+    if sparse.issparse(train_data):
+        # TruncatedSVD needs strictly fewer components than features
+        n_components = min(n_components, train_data.shape[1] - 1)
+        pipeline = make_pipeline(StandardScaler(with_mean=False),
+                                 TruncatedSVD(n_components=n_components, random_state=RANDOM_STATE))
+    else:
+        pipeline = make_pipeline(StandardScaler(),
+                                 PCA(n_components=n_components, svd_solver=svd_solver,
+                                     random_state=RANDOM_STATE))
+    pipeline.fit(train_data)
+    return np.cumsum(pipeline.steps[1][1].explained_variance_ratio_)
+
+def get_num_pcas (train_data, var_explained=0.9, max_components=20, svd_solver='full',
+                  plot=True, return_curve=False):
     # Determine the number of principal components to achieve target explained variance
-    cum_explained_variance_ratios = [0]
+    # The whole curve comes from one decomposition; pass plot=False to skip plotting
+    # (e.g. in batch runs) and return_curve=True to also get the curve back.
+    cum_explained_variance_ratios = explained_variance_curve(train_data, max_components, svd_solver)
 
     # default number of PCA to number of features
     n_pca = train_data.shape[1]
-    for n in range(1, 21):
-        pipeline = make_pipeline(StandardScaler(), PCA(n_components=n))
-        pipeline.fit_transform(train_data)
-        pca = pipeline.steps[1][1]
-        cum_explained_variance_ratios.append(np.sum(pca.explained_variance_ratio_))
-        # stop once we've hit the target variance explained
-        if (np.sum(pca.explained_variance_ratio_) >= var_explained):
-            # store n_pca for future use
-            print ('With %d principal components, variance explained = %.3f.' %
-                   (n, np.sum(pca.explained_variance_ratio_)))
-            n_pca = n
-            break
-
-    plt.plot(np.array(cum_explained_variance_ratios))
-    plt.xlabel('# Principal Components')
-    plt.ylabel('% Variance Explained')
-    plt.grid()
-    plt.show()
-
+    reached = np.nonzero(cum_explained_variance_ratios >= var_explained)[0]
+    if len(reached) > 0:
+        # store n_pca for future use
+        n_pca = reached[0] + 1
+        print ('With %d principal components, variance explained = %.3f.' %
+               (n_pca, cum_explained_variance_ratios[n_pca - 1]))
+
+    if plot:
+        # only plot up to the point where we hit the target, starting from 0 components
+        plt.plot(np.concatenate([[0], cum_explained_variance_ratios[:min(n_pca, max_components)]]))
+        plt.xlabel('# Principal Components')
+        plt.ylabel('% Variance Explained')
+        plt.grid()
+        plt.show()
+
+    if return_curve:
+        return n_pca, cum_explained_variance_ratios
     return n_pca
 
 def ohe_data(train_data, test_data, factor_cols=['zip','district']):
@@ -155,24 +218,34 @@ def ohe_data(train_data, test_data, factor_cols=['zip','district']):
     return train_data_ohe, test_data_ohe
     
 
-def read_data(data_file='data_merged/combined_data_2018-07-30.csv', do_imputation=False):
+# these columns cannot/should not be imputed
+# notably, don't impute for `school_income_estimate` because too many missing values
+NON_IMPUTE_COLS = ['dbn',
+                   'school_name',
+                   'district',
+                   'zip',
+                   'school_income_estimate']
 
-    merged_df = pd.read_csv(data_file)
+# date of the last merged CSVs (data_merged/combined_data_<date>.csv); newer data is in the snapshot store
+MERGED_DATE = '2018-07-30'
 
-    if do_imputation:
-        # these columns cannot/should not be imputed
-        # notably, don't impute for `school_income_estimate` because too many missing values
-        non_impute_cols = ['dbn',
-                           'school_name',
-                           'district',
-                           'zip',
-                           'school_income_estimate']
+def load_merged_data(data_file, do_imputation=False):
+    """Parse the merged dataset, optionally imputing missing numeric values to the column mean"""
+    return prepare_merged_data(pd.read_csv(data_file), do_imputation)
 
+def prepare_merged_data(merged_df, do_imputation=False):
+    """Index a merged dataset (as read from CSV or a snapshot) by DBN code, optionally imputing"""
+    # index by DBN code (the dbn strings stay as a column, for display)
+    merged_df.index = pd.Index(dbncode.encode(merged_df['dbn']), name=dbncode.INDEX_NAME)
+
+    if do_imputation:
         # temporarily split out the non-numeric cols into a separate dataframe
-        tmp_non_numeric_df = merged_df[non_impute_cols]
-        tmp_numeric_df = merged_df.drop(non_impute_cols, axis=1)
+        tmp_non_numeric_df = merged_df[NON_IMPUTE_COLS]
+        tmp_numeric_df = merged_df.drop(NON_IMPUTE_COLS, axis=1)
 
         # do imputation of missing values to column mean
+        # (these means include the test rows; imputation.FoldMeanImputer inside the
+        # model pipeline learns them from each fold's training rows instead)
         imp = Imputer(missing_values=np.nan, strategy='mean', axis=0)
         tmp_imputed_df = pd.DataFrame(imp.fit_transform(tmp_numeric_df))
         tmp_imputed_df.columns = tmp_numeric_df.columns
@@ -183,14 +256,50 @@ def read_data(data_file='data_merged/combined_data_2018-07-30.csv', do_imputatio
     else:
         imputed_df = merged_df
 
+    return imputed_df
+
+def merged_data_file(dataset='combined_data'):
+    """The dated CSV prep_merge wrote `dataset` to, before it saved snapshots"""
+    return 'data_merged/%s_%s.csv' % (dataset, MERGED_DATE)
+
+def read_merged_data(dataset='combined_data', snapshot='latest', data_file=None, do_imputation=False,
+                     use_cache=True):
+    '''
+        A merged dataset ('combined_data' or 'combined_data_no_class_sizes'),
+        indexed by DBN code: the `snapshot` tag (or id) of it in the snapshot
+        store.  Its dated CSV is read instead if no snapshot has been saved yet,
+        or when a data_file is given.
+    '''
+    if data_file is None and snapshot is not None and snapshots.has_store():
+        merged_df = snapshots.SnapshotStore().load(dataset, snapshot)
+        return prepare_merged_data(merged_df, do_imputation=do_imputation)
+    data_file = data_file or merged_data_file(dataset)
+    # parsing (and imputation) is cached on disk, keyed by the file's contents and do_imputation
+    if use_cache:
+        return datacache.cached_frame(data_file, load_merged_data, do_imputation=do_imputation)
+    return load_merged_data(data_file, do_imputation=do_imputation)
+
+def read_data(data_file=None, do_imputation=False, use_cache=True, snapshot='latest',
+              dataset='combined_data'):
+
+    # the latest snapshot by default; see read_merged_data
+    imputed_df = read_merged_data(dataset, snapshot, data_file, do_imputation=do_imputation,
+                                  use_cache=use_cache)
+
     # split into features (X) and labels (y)
     X = imputed_df.loc[:, ~imputed_df.columns.isin(['high_registrations'])]
     y = imputed_df.loc[:, imputed_df.columns.isin(['high_registrations'])]
-    train_data, test_data, train_labels, test_labels = our_train_test_split(X, y, stratify=y)
+
+    # the stratified split (same rows as our_train_test_split) is saved once per label vector
+    train_idx, test_idx = folds.split_plan(y.values.ravel(), TEST_SIZE, RANDOM_STATE)
+    train_data, test_data = X.iloc[train_idx], X.iloc[test_idx]
 
     # convert y values into 1D array, as expected by sklearn classifiers
-    train_labels = train_labels.values.ravel()
-    test_labels = test_labels.values.ravel()
+    train_labels = y.values.ravel()[train_idx]
+    test_labels = y.values.ravel()[test_idx]
+
+    # also save the repeated k-fold plan used by run_model_get_ordered_predictions
+    folds.fold_plan(np.concatenate((train_labels, test_labels)))
 
     # confirm stratification
     print('Train: %d observations (positive class fraction: %.3f)' %
@@ -200,9 +309,128 @@ def read_data(data_file='data_merged/combined_data_2018-07-30.csv', do_imputatio
 
     return train_data, test_data, train_labels, test_labels
 
-def print_cv_results(cv_scores):
+### Chunked (out-of-core) reading, for datasets too big to load at once
+
+def _pinned_dtypes(data_file):
+    """Fix each column's dtype up front so every chunk parses the same way:
+    text columns as strings, everything else as float64 (which can hold NaN)"""
+    columns = pd.read_csv(data_file, nrows=0).columns
+    return {c: (object if c in ['dbn', 'school_name'] else np.float64) for c in columns}
+
+def column_means_chunked(data_file, chunksize=10000):
+    """Means of the imputable columns, accumulated over one pass through the file"""
+    sums, counts = 0, 0
+    for chunk in pd.read_csv(data_file, chunksize=chunksize, dtype=_pinned_dtypes(data_file)):
+        numeric = chunk.drop(NON_IMPUTE_COLS, axis=1)
+        sums = sums + numeric.sum()
+        counts = counts + numeric.count()
+    return sums / counts
+
+def _can_stratify(y):
+    """Whether train_test_split can stratify labels `y` with TEST_SIZE"""
+    counts = np.bincount(y)
+    counts = counts[counts > 0]
+    n_test = int(np.ceil(len(y) * TEST_SIZE))
+    # every class needs two members, and a place in both the train and the test set
+    return len(y) > 0 and counts.min() >= 2 and min(n_test, len(y) - n_test) >= len(counts)
+
+def _split_chunk(chunk, i):
+    X = chunk.loc[:, ~chunk.columns.isin(['high_registrations'])]
+    y = chunk['high_registrations'].values.astype(int)
+    if len(y) < 2:
+        # nothing to split: the row goes to the training set
+        return X, X.iloc[:0], y, y[:0]
+    stratify = y if _can_stratify(y) else None
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE + i,
+                            stratify=stratify)
+
+def read_data_chunked(data_file='data_merged/combined_data_2018-07-30.csv', do_imputation=False,
+                      chunksize=10000):
+    '''
+        Streaming version of read_data(): yields (train_data, test_data, train_labels, test_labels)
+        for one chunk of about `chunksize` rows at a time. With do_imputation, the column
+        means are computed in a first pass over the file and filled in on the second.
+        Each chunk gets its own stratified split, so the overall split is stratified
+        too, but it won't pick the same rows as read_data().  A last chunk too small
+        to stratify is split together with the chunk before it.
+    '''
+    dtypes = _pinned_dtypes(data_file)
+    if do_imputation:
+        means = column_means_chunked(data_file, chunksize)
+
+    i = 0
+    pending = None
+    for chunk in pd.read_csv(data_file, chunksize=chunksize, dtype=dtypes):
+        if do_imputation:
+            chunk = chunk.fillna(means)
+        # index by DBN code, as read_data does
+        chunk = dbncode.index_by_code(chunk, drop=False)
+
+        if pending is not None and not _can_stratify(chunk['high_registrations'].values.astype(int)):
+            pending = pd.concat([pending, chunk])
+            continue
+        if pending is not None:
+            yield _split_chunk(pending, i)
+            i += 1
+        pending = chunk
+    if pending is not None:
+        yield _split_chunk(pending, i)
+
+# the class size file columns prep_class_sizes uses, and how to parse them
+CLASS_SIZE_DTYPES = {'DBN': object,
+                     'Grade Level': object,
+                     'Department': object,
+                     'Number of Students': np.int64,
+                     'Number of Classes': np.int64,
+                     'School Pupil-Teacher Ratio': np.float64}
+
+def read_class_sizes(data_file='data_raw/February2017_Avg_ClassSize_School_all.csv',
+                     grade_level='MS Core', chunksize=10000):
+    '''
+        One pass over the class size file: only the CLASS_SIZE_DTYPES columns are
+        parsed, rows of other grade levels are dropped chunk by chunk, and each
+        chunk is folded into running totals, so neither the full file nor the
+        filtered rows are ever held in memory.
+        returns: class_stats (number_of_students and number_of_classes summed by
+                 (dbn, department), plus average_class_size) and the mean
+                 school_pupil_teacher_ratio of each dbn
+    '''
+    counts = ['number_of_students', 'number_of_classes']
+    totals, ratio_sums, ratio_counts = None, None, None
+    for chunk in pd.read_csv(data_file, chunksize=chunksize, usecols=list(CLASS_SIZE_DTYPES),
+                             dtype=CLASS_SIZE_DTYPES):
+        chunk = chunk[chunk['Grade Level'] == grade_level]
+        chunk.columns = [sanitize_column_names(c) for c in chunk.columns]
+
+        part = chunk.groupby(['dbn', 'department'])[counts].sum()
+        ratios = chunk.groupby('dbn')['school_pupil_teacher_ratio'].agg(['sum', 'count'])
+        if totals is None:
+            totals, ratio_sums, ratio_counts = part, ratios['sum'], ratios['count']
+        else:
+            totals = totals.add(part, fill_value=0)
+            ratio_sums = ratio_sums.add(ratios['sum'], fill_value=0)
+            ratio_counts = ratio_counts.add(ratios['count'], fill_value=0)
+
+    class_stats = totals.sort_index()
+    class_stats['average_class_size'] = class_stats['number_of_students'] / class_stats['number_of_classes']
+    ratio = (ratio_sums / ratio_counts).sort_index()
+    ratio.name = 'school_pupil_teacher_ratio'
+    return class_stats, ratio
+
+def print_cv_results(cv_scores, n_resamples=10000):
+    """Print accuracy and F1 with 95% confidence intervals. If cv_scores holds the
+    out-of-fold 'labels' and 'predictions' (as cross_validate_folds returns), the
+    intervals are bootstrapped from those; otherwise they're mean +/- 1.96 std
+    of the fold scores."""
     k_folds = len(cv_scores['test_accuracy'])	# any of them will do
 
+    if 'predictions' in cv_scores:
+        ci = metrics.bootstrap_ci(cv_scores['labels'], cv_scores['predictions'], n_resamples)
+        print('With %d-fold cross-validation, accuracy is: %.3f (95%% bootstrap CI from %.3f to %.3f).' %
+              ((k_folds,) + ci['accuracy']))
+        print('The F1 score is: %.3f (95%% bootstrap CI from %.3f to %.3f).' % ci['f1'])
+        return
+
     # display accuracy with 95% confidence interval
     cv_accuracy = cv_scores['test_accuracy']
     print('With %d-fold cross-validation, accuracy is: %.3f (95%% CI from %.3f to %.3f).' %
@@ -215,90 +443,186 @@ def print_cv_results(cv_scores):
           (cv_f1.mean(), cv_f1.mean() - 1.96 * cv_f1.std(),
            cv_f1.mean() + 1.96 * cv_f1.std()))
 
+def print_bootstrap_results(labels, predicted_labels, n_resamples=10000):
+    """Accuracy and F1 with bootstrapped 95% confidence intervals, for any set of
+    predictions (e.g. out-of-fold or test set predictions)"""
+    ci = metrics.bootstrap_ci(labels, predicted_labels, n_resamples)
+    print('Accuracy is: %.3f (95%% bootstrap CI from %.3f to %.3f).' % ci['accuracy'])
+    print('The F1 score is: %.3f (95%% bootstrap CI from %.3f to %.3f).' % ci['f1'])
+
+
+def cross_validate_folds(pipeline, train_data, train_labels, k_folds=5, n_jobs=1, fit_cache=None):
+    """Like sklearn's cross_validate(pipeline, ..., cv=k_folds, scoring=['accuracy','f1'])
+    (same stratified folds), but fitting through predict_folds so that folds can
+    run in parallel and be cached. The result also holds the out-of-fold
+    'predictions' (and 'labels'), so print_cv_results can bootstrap its intervals."""
+    fold_indices = list(StratifiedKFold(n_splits=k_folds).split(train_data, train_labels))
+    fold_predictions = predict_folds(pipeline, train_data, train_labels, fold_indices,
+                                     n_jobs=n_jobs, fit_cache=fit_cache)
+    accuracy, f1 = [], []
+    oof_predictions = np.empty_like(train_labels)
+    for (train, test), (predicted_labels, _) in zip(fold_indices, fold_predictions):
+        accuracy.append(accuracy_score(train_labels[test], predicted_labels))
+        f1.append(f1_score(train_labels[test], predicted_labels))
+        oof_predictions[test] = predicted_labels
+    return {'test_accuracy': np.array(accuracy), 'test_f1': np.array(f1),
+            'labels': train_labels, 'predictions': oof_predictions}
+
+
+### Parallel fold fitting
+# Worker processes get the feature matrix once, through a memory-mapped .npy
+# file, so each task only has to carry the pipeline and the fold's indices.
+# (Object arrays can't be memory-mapped, so those are pickled instead.)
+# Dataframes are rebuilt around the fold's rows (with their index, column
+# names and dtypes), so pipelines see the same input as in the sequential path.
+_worker_data = {}
+
+def _init_fold_worker(X_path, y, index=None, columns=None, dtypes=None):
+    if X_path.endswith('.pkl'):
+        with open(X_path, 'rb') as f:
+            _worker_data['X'] = pickle.load(f)
+    else:
+        _worker_data['X'] = np.load(X_path, mmap_mode='r')
+    _worker_data['y'] = y
+    _worker_data['index'] = index
+    _worker_data['columns'] = columns
+    _worker_data['dtypes'] = dtypes
+
+def _fold_rows(rows):
+    X, index, columns = _worker_data['X'], _worker_data['index'], _worker_data['columns']
+    if columns is None:
+        return X[rows]
+    return pd.DataFrame(X[rows], index=index[rows], columns=columns).astype(_worker_data['dtypes'])
+
+def _fit_predict_fold(task):
+    pipeline, train, test, with_proba = task
+    y = _worker_data['y']
+    return _fit_predict(pipeline, _fold_rows(train), y[train], _fold_rows(test), with_proba)
+
+def _fit_predict(pipeline, X_train, y_train, X_test, with_proba):
+    pipeline.fit(X_train, y_train)
+    # probability of the positive class, if asked for
+    proba = pipeline.predict_proba(X_test)[:, 1] if with_proba else None
+    return pipeline.predict(X_test), proba
+
+def predict_folds(pipeline, X, y, fold_indices, n_jobs=1, with_proba=False, fit_cache=None):
+    """Fit `pipeline` on each fold's training rows and predict its test rows.
+    Returns (predicted labels, positive class probabilities or None) for each
+    fold, in fold order. With n_jobs > 1 (or -1 for all cores) folds are fitted
+    in a process pool, on copies of the pipeline. Pass a fitcache.FitCache to
+    reuse the results of folds that were already fitted with the same inputs."""
+    if fit_cache is None:
+        return _predict_folds(pipeline, X, y, fold_indices, n_jobs, with_proba)
+
+    keys = fit_cache.fold_keys(pipeline, X, y, fold_indices, with_proba)
+    results = [fit_cache.get(key) for key in keys]
+
+    # only fit the folds that weren't in the cache
+    missing = [i for i, result in enumerate(results) if result is None]
+    fitted = _predict_folds(pipeline, X, y, [fold_indices[i] for i in missing], n_jobs, with_proba)
+    for i, result in zip(missing, fitted):
+        fit_cache.put(keys[i], *result)
+        results[i] = result
+    return results
+
+def _rows(X, rows):
+    """Rows of a dataframe or an array, by position"""
+    return X.iloc[rows] if isinstance(X, pd.DataFrame) else X[rows]
+
+def _predict_folds(pipeline, X, y, fold_indices, n_jobs, with_proba):
+    if not fold_indices:
+        return []
+    if n_jobs == 1:
+        return [_fit_predict(pipeline, _rows(X, train), y[train, ], _rows(X, test), with_proba)
+                for train, test in fold_indices]
+
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        X_values = np.asarray(X)
+        if X_values.dtype == object:
+            X_path = os.path.join(tmp_dir, 'X.pkl')
+            with open(X_path, 'wb') as f:
+                pickle.dump(X_values, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            X_path = os.path.join(tmp_dir, 'X.npy')
+            np.save(X_path, X_values)
+        frame_args = (X.index, X.columns, X.dtypes) if isinstance(X, pd.DataFrame) else ()
+        with multiprocessing.Pool(n_jobs, initializer=_init_fold_worker,
+                                  initargs=(X_path, y) + frame_args) as pool:
+            tasks = ((clone(pipeline), train, test, with_proba) for train, test in fold_indices)
+            return list(pool.imap(_fit_predict_fold, tasks))
+    finally:
+        shutil.rmtree(tmp_dir)
 
 def run_model_get_ordered_predictions(pipeline,
                                       train_orig, test_orig,
                                       train_best, test_best,
-                                      train_labels, test_labels):
+                                      train_labels, test_labels, n_jobs=1, with_proba=False,
+                                      fit_cache=None, return_votes=False):
     """Function that runs a model and returns results that represent
     an ordering over schools that are most likely to have high registrations
-    and schools that are least likely to have high registrations."""
+    and schools that are least likely to have high registrations.
+    Pass n_jobs > 1 (or -1 for all cores) to fit the folds in parallel,
+    with_proba=True to add the mean predicted probability of a 1 ('1_prob'),
+    and a fitcache.FitCache to skip refitting folds whose inputs haven't changed.
+    With return_votes=True, also returns the (schools x folds) vote matrix, for
+    the rank intervals in create_passnyc_list."""
     # recombine train and test data into an aggregate dataset
     X_orig = pd.concat([train_orig, test_orig], sort=True)  # including all columns (need for display purposes)
     X_best = pd.concat([train_best, test_best], sort=True)  # only columns from best model
     y = np.concatenate((train_labels, test_labels))
 
     # Run k-fold cross-validation with 5 folds 10 times, which means every school is predicted 10 times.
-    folds = 5
-    repeats = 10
-    rskf = RepeatedStratifiedKFold(n_splits=folds, n_repeats=repeats, random_state=207)
-
-    # Build dataframes for storing predictions, with columns for each k-fold
-    fold_list = []
-    for f in range(1, (folds * repeats) + 1):
-        fold_list.append('k{}'.format(f))
-    predictions = pd.DataFrame(index=X_best.index, columns=fold_list)
-
-    counter = 1
-    for train, test in rskf.split(X_best, y):
-        pipeline.fit(X_best.iloc[train, ], y[train, ])
-        predicted_labels = pipeline.predict(X_best.iloc[test, ])
-        predictions.iloc[test, counter - 1] = predicted_labels
-        counter += 1
-
-    # Create columns for predictions and labels
-    predictions['1s'] = predictions.iloc[:, :50].sum(axis=1)
-    predictions['0s'] = (predictions.iloc[:, :50] == 0).sum(axis=1)
-    predictions['true'] = y
+    # The folds come from the saved fold plan, so every model sees the same ones.
+    n_folds = folds.N_SPLITS
+    repeats = folds.N_REPEATS
+    fold_indices = folds.fold_plan(y, n_folds, repeats, random_state=207)
+
+    # One row per school and one column per fold; -1 marks folds where the school was in training
+    votes = np.full((len(y), n_folds * repeats), -1, dtype=np.int8)
+    probs = np.full(votes.shape, np.nan, dtype=np.float32) if with_proba else None
+
+    fold_predictions = predict_folds(pipeline, X_best, y, fold_indices, n_jobs, with_proba, fit_cache)
+    for k, ((train, test), (predicted_labels, predicted_probs)) in enumerate(zip(fold_indices,
+                                                                                  fold_predictions)):
+        votes[test, k] = predicted_labels
+        if with_proba:
+            probs[test, k] = predicted_probs
 
     # Create a table of all features along with the number of votes each received and the true value
-    X_predicted = pd.concat([X_orig, predictions['1s'], predictions['0s'],
-                             pd.DataFrame(y)], axis=1, join_axes=[X_best.index])
-    # Rename the y columns to be more descriptive
-    X_predicted.rename(columns={0: "high_registrations"}, inplace=True)
+    X_predicted = X_orig.reindex(X_best.index)
+    X_predicted['1s'] = (votes == 1).sum(axis=1)
+    X_predicted['0s'] = (votes == 0).sum(axis=1)
+    X_predicted['high_registrations'] = y
+    if with_proba:
+        X_predicted['1_prob'] = np.nanmean(probs, axis=1)
     # Sort by number of votes, most votes for 1 at the top and most votes for 0 at the bottom
     X_predicted = X_predicted.sort_values(by=['1s', '0s'], ascending=[False, True])
 
+    if return_votes:
+        fold_list = ['k{}'.format(f) for f in range(1, (n_folds * repeats) + 1)]
+        return X_predicted, pd.DataFrame(votes, index=X_best.index, columns=fold_list)
     return X_predicted
 
 
-def create_passnyc_list(X_predicted, train_orig, test_orig, train_labels, test_labels):
-    """Function that takes the false positives and returns a rank order dataframe"""
+def create_passnyc_list(X_predicted, train_orig, test_orig, train_labels, test_labels,
+                        fold_votes=None, n_resamples=2000, top_k=20):
+    """Function that takes the false positives and returns a rank order dataframe
+    (to score several models in one pass, use scoring.create_passnyc_lists).
+    Pass the fold votes from run_model_get_ordered_predictions(..., return_votes=True)
+    to add bootstrapped rank intervals and the probability of making the top_k."""
 
-    # Retrain only the columns of interest for PASSNYC prioritization
-    fp_features = ['1s',
-                  'dbn',
-                  'school_name',
-                  'economic_need_index',
-                  'grade_7_enrollment',
-                  'num_shsat_test_takers',
-                  'pct_test_takers',
-                  'percent_black__hispanic'
-                  ]
-    df_passnyc = X_predicted[fp_features]
+    # Determine the median percentage of test takers among high_registrations schools
+    median_pct = scoring.median_target_pct(train_orig, test_orig, train_labels, test_labels)
 
-    X_orig = pd.concat([train_orig, test_orig], sort=True)  # including all columns (need for display purposes)
-    y = np.concatenate((train_labels, test_labels))
-
-    # Determine the number of test takers this school would have needed to meet
-    #   the median percentage of high_registrations
-    median_pct = np.median(X_orig[y == 1]['pct_test_takers']) / 100
-    target_test_takers = np.multiply(df_passnyc['grade_7_enrollment'], median_pct)
-
-    # Subtract the number of actual test takers from the hypothetical minimum number
-    delta = target_test_takers - df_passnyc['num_shsat_test_takers']
+    # Score this model's votes, sort descending and create a rank order column
+    df_passnyc = scoring.create_passnyc_lists(X_predicted[['1s']], X_predicted, median_pct)['1s']
 
-    # Multiply the delta by the minority percentage of the school to determine how many minority
-    #   students did not take the test
-    minority_delta = np.round(np.multiply(delta, df_passnyc['percent_black__hispanic'] / 100), 0).astype(int)
-    df_passnyc = df_passnyc.assign(minority_delta=minority_delta)
-
-    # Multiply the minority delta by the percentage of 1 votes to get a confidence-adjusted 'score'
-    df_passnyc = df_passnyc.assign(score=np.multiply(df_passnyc['minority_delta'], df_passnyc['1s'] / 10))
-
-    # sort descending and create a rank order column
-    df_passnyc = df_passnyc.sort_values(by='score', ascending=False)
-    df_passnyc.insert(0, 'rank', range(1, df_passnyc.shape[0] + 1))
+    if fold_votes is not None:
+        uncertainty = scoring.rank_uncertainty(fold_votes, X_predicted.loc[fold_votes.index],
+                                               median_pct, n_resamples=n_resamples, top_k=top_k,
+                                               n_splits=folds.N_SPLITS)
+        df_passnyc = df_passnyc.join(uncertainty)
 
     return df_passnyc
-